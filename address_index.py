@@ -0,0 +1,77 @@
+from bisect import bisect_left
+from sqlalchemy import Engine
+import pandas as pd
+import re
+
+import snapshot
+
+# same spelled-out street types neighbors_address shortens, plus the other common ones
+ABBREVIATIONS = {
+    "STREET": "ST", "AVENUE": "AVE", "BOULEVARD": "BLVD", "ROAD": "RD", "LANE": "LN", "DRIVE": "DR",
+    "COURT": "CT", "PLACE": "PL", "PARKWAY": "PKWY", "CIRCLE": "CIR", "TERRACE": "TER", "TRAIL": "TRL",
+}
+
+# how far past the first match to look when ranking, keeps short prefixes like "1" cheap
+SCAN_LIMIT = 500
+
+
+def normalize_address(address: str):
+    """Upper case, single spaced, street types abbreviated; trailing space kept so 'MAIN ' only matches the word."""
+    text = re.sub(r"\s+", " ", address.upper().replace("%20", " ")).lstrip()
+    trailing = text.endswith(" ")
+    tokens = [ABBREVIATIONS.get(token, token) for token in text.split()]
+    return " ".join(tokens) + (" " if trailing and tokens else "")
+
+
+class AddressIndex:
+    """Sorted normalized addresses per city (and county wide) for bisect prefix lookups."""
+
+    def __init__(self, frame: pd.DataFrame):
+        df = pd.DataFrame({
+            "key": frame["prpaddress"].fillna("").map(normalize_address),
+            "city": snapshot.normalize(frame["prpctynam"]).fillna(""),
+            "address": frame["prpaddress"],
+            "property_city": frame["prpctynam"],
+            "zip": frame["prpzip5"],
+            "pin": frame["pin"],
+            "objectid": frame["objectid"],
+        })
+        df = df[df["key"] != ""]
+        # one suggestion per address and city, the lowest objectid stands in for multi record parcels
+        df = df.sort_values(["key", "city", "objectid"], kind="mergesort").drop_duplicates(["key", "city"])
+        rows = df.drop(columns=["key", "city"]).rename(columns={"property_city": "city"})
+        self.rows = rows.astype(object).where(rows.notna(), None).to_dict(orient="records")
+        self.keys = df["key"].tolist()
+        self.positions = list(range(len(self.keys)))
+
+        self.cities = {}
+        for city, group in df.reset_index(drop=True).reset_index().groupby("city", sort=False):
+            self.cities[city] = (group["key"].tolist(), group["index"].tolist())
+
+    def suggest(self, q: str, city: str or None = None, limit: int = 10):
+        prefix = normalize_address(q)
+        if not prefix.strip():
+            return []
+        if city:
+            keys, positions = self.cities.get(snapshot.normalize_key(city), ([], []))
+        else:
+            keys, positions = self.keys, self.positions
+
+        start = bisect_left(keys, prefix)
+        candidates = []
+        for i in range(start, min(len(keys), start + SCAN_LIMIT)):
+            key = keys[i]
+            if not key.startswith(prefix):
+                break
+            # exact address first, then completions ending on a word boundary, then shorter (closer) keys
+            boundary = len(key) == len(prefix) or key[len(prefix)] == " " or prefix.endswith(" ")
+            candidates.append(((key != prefix.rstrip(), not boundary, len(key), key), positions[i]))
+
+        candidates.sort(key=lambda c: c[0])
+        return [self.rows[position] for _, position in candidates[:limit]]
+
+
+def suggest(engine: Engine, q: str, city: str or None = None, limit: int = 10):
+    """Ranked address completions with pin/objectid for a partial address, optionally within a city."""
+    index = snapshot.derived(engine, "address_index", AddressIndex)
+    return index.suggest(q, city, limit)
@@ -0,0 +1,171 @@
+from contextvars import ContextVar
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import Engine, event, exc
+import asyncio
+
+# per class: concurrent requests, how many may wait behind them, how long they wait (seconds),
+# Postgres statement_timeout for their queries (ms) and the Retry-After sent when shedding
+CLASSES = {
+    "critical": {"limit": None, "queue": None, "queue_wait": None, "statement_timeout_ms": 5_000, "retry_after": 1},
+    "standard": {"limit": 8, "queue": 32, "queue_wait": 2.0, "statement_timeout_ms": 15_000, "retry_after": 2},
+    "expensive": {"limit": 2, "queue": 4, "queue_wait": 5.0, "statement_timeout_ms": 30_000, "retry_after": 10},
+}
+
+# path prefix -> class, first match wins, everything else is standard
+ROUTES = [
+    ("/whoami", "critical"), ("/ready", "critical"), ("/metrics", "critical"), ("/diagnostics", "critical"),
+    ("/admin", "critical"),
+    ("/owners", "critical"), ("/addresses/suggest", "critical"), ("/parcels/nearest", "critical"),
+    ("/jobs", "critical"),
+    ("/occupancy-city", "expensive"), ("/property-types-city", "expensive"), ("/turnover/", "expensive"),
+    ("/neighbors", "expensive"), ("/property-distance-comps", "expensive"), ("/export/", "expensive"),
+    ("/parcels/region", "expensive"),
+]
+
+# class of the request being served, read by the statement timeout hook and overload()
+_current_class = ContextVar("admission_class", default=None)
+
+
+class _Limiter:
+    def __init__(self, limit: int or None):
+        self.semaphore = asyncio.Semaphore(limit) if limit else None
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timeouts = 0
+
+
+_limiters = {name: _Limiter(limits["limit"]) for name, limits in CLASSES.items()}
+
+
+def route_class(path: str):
+    for prefix, name in ROUTES:
+        if path.startswith(prefix):
+            return name
+    return "standard"
+
+
+def _busy(name: str):
+    _limiters[name].shed += 1
+    retry_after = CLASSES[name]["retry_after"]
+    return JSONResponse({"detail": "Server is busy, please retry later."}, status_code=503,
+                        headers={"Retry-After": str(retry_after)})
+
+
+async def admit(request: Request, call_next):
+    """
+    Middleware: every request takes a slot in its route's class, waiting in a bounded queue for
+    at most queue_wait; past that it is shed with a 503 instead of piling onto the database.
+    """
+    name = route_class(request.url.path)
+    limits = CLASSES[name]
+    limiter = _limiters[name]
+
+    if limiter.semaphore is not None:
+        if limiter.semaphore.locked() and limiter.waiting >= limits["queue"]:
+            return _busy(name)
+        limiter.waiting += 1
+        try:
+            await asyncio.wait_for(limiter.semaphore.acquire(), limits["queue_wait"])
+        except asyncio.TimeoutError:
+            return _busy(name)
+        finally:
+            limiter.waiting -= 1
+
+    limiter.in_flight += 1
+    limiter.admitted += 1
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            limiter.in_flight -= 1
+            if limiter.semaphore is not None:
+                limiter.semaphore.release()
+
+    token = _current_class.set(name)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        release()
+        raise
+    finally:
+        _current_class.reset(token)
+
+    # the body is still being produced (exports stream COPY and Arrow/Parquet encoding from it),
+    # so the slot is held until it has been sent or the client went away
+    body = response.body_iterator
+
+    async def hold_slot():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            release()
+
+    response.body_iterator = hold_slot()
+    previous = response.background
+
+    async def after_response():
+        # a body that was never iterated (its generator is then never started) still frees the slot
+        release()
+        if previous is not None:
+            await previous()
+
+    response.background = BackgroundTask(after_response)
+    return response
+
+
+def _new_transaction(conn):
+    # SET LOCAL ends with the transaction (commit, rollback, reset on return or a cancelled query)
+    conn.info.pop("statement_timeout", None)
+
+
+def _apply_statement_timeout(conn, cursor, statement, parameters, context, executemany):
+    """SET LOCAL statement_timeout for the request's class once per transaction, before its first statement."""
+    name = _current_class.get()
+    if name is None:
+        return
+    timeout = CLASSES[name]["statement_timeout_ms"]
+    if conn.info.get("statement_timeout") != timeout:
+        cursor.execute(f"SET LOCAL statement_timeout = {int(timeout)}")
+        conn.info["statement_timeout"] = timeout
+
+
+def install(engine: Engine):
+    """Hooks per-request statement timeouts into a Postgres engine (other databases have no statement_timeout)."""
+    if engine.dialect.name == "postgresql":
+        event.listen(engine, "begin", _new_transaction)
+        event.listen(engine, "before_cursor_execute", _apply_statement_timeout)
+
+
+def overload(e: Exception):
+    """(detail, retry after) when e means the database is saturated or a query hit its timeout, else None."""
+    if isinstance(e, exc.TimeoutError):
+        detail = "No database connection available, please retry later."
+    elif isinstance(e, exc.DBAPIError) and getattr(e.orig, "pgcode", None) == "57014":
+        detail = "The query took too long and was cancelled."
+    else:
+        return None
+    name = _current_class.get() or "standard"
+    _limiters[name].timeouts += 1
+    return detail, CLASSES[name]["retry_after"]
+
+
+def metrics():
+    return {
+        name: {
+            "limit": CLASSES[name]["limit"],
+            "queue": CLASSES[name]["queue"],
+            "in_flight": limiter.in_flight,
+            "waiting": limiter.waiting,
+            "admitted": limiter.admitted,
+            "shed": limiter.shed,
+            "timeouts": limiter.timeouts,
+        }
+        for name, limiter in _limiters.items()
+    }
@@ -0,0 +1,83 @@
+"""
+Import-time budget for worker boot and the CLIs: imports each entry module in fresh interpreters
+with `python -X importtime` and fails (exit 1) when the best cumulative time goes over its budget
+or a module that should load lazily was imported.
+
+    python benchmarks/bench_import_time.py [--runs 7] [--top 15]
+
+IMPORT_BUDGET_SCALE multiplies every budget for slower machines.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# entry module -> best-of-runs cumulative import time budget (seconds)
+BUDGETS = {
+    "main": 1.8,
+    "query": 1.1,
+    "ingest": 1.1,
+}
+
+# loaded on first use only (lazy.module / local imports), importing the entry module must not pull them in
+LAZY = ["matplotlib", "plotly", "pyproj", "pyarrow.csv", "pyarrow.parquet", "uvicorn"]
+
+SCALE = float(os.getenv("IMPORT_BUDGET_SCALE", "1"))
+
+
+def _import(module: str):
+    """One fresh interpreter: ({imported module: cumulative microseconds}, modules loaded afterwards)."""
+    code = f"import {module}, sys, json; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split(":", 1)[1].split("|")
+        times[name.strip()] = int(cumulative)
+    return times, set(json.loads(result.stdout.splitlines()[-1]))
+
+
+def measure(module: str, runs: int):
+    samples, loaded = [], set()
+    for _ in range(runs):
+        times, loaded = _import(module)
+        samples.append(times)
+    # best of the runs, the least disturbed by whatever else the machine is doing
+    total = min(times[module] for times in samples) / 1e6
+    # slowest direct and indirect imports, median across runs
+    names = set().union(*samples)
+    slowest = sorted(((statistics.median(t.get(n, 0) for t in samples) / 1e6, n) for n in names if n != module),
+                     reverse=True)
+    return total, slowest, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check import times against their budgets.")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list per module")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS))
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        budget = BUDGETS.get(module, 1.0) * SCALE
+        total, slowest, loaded = measure(module, args.runs)
+        eager = [name for name in LAZY if name in loaded]
+        ok = total <= budget and not eager
+        failed |= not ok
+        print(f"{module:<10} {total * 1000:8.1f} ms  budget {budget * 1000:8.1f} ms  {'ok' if ok else 'FAIL'}")
+        if eager:
+            print(f"  loaded eagerly: {', '.join(eager)}")
+        for seconds, name in slowest[:args.top]:
+            print(f"  {seconds * 1000:8.1f} ms  {name}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+from sqlalchemy import Engine
+import numpy as np
+import pandas as pd
+
+import snapshot
+
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+DEFAULT_BINS = 20
+
+# comps group -> snapshot column it is keyed on
+GROUP_COLUMNS = {
+    "city": "prpctynam",
+    "neighborhood": "nhdnam",
+}
+
+
+def _histogram(values: np.ndarray, bins: int):
+    """Bin counts for an already sorted array, same bin semantics as np.histogram."""
+    edges = np.linspace(values[0], values[-1], bins + 1)
+    inner = np.searchsorted(values, edges[1:-1], side="left")
+    counts = np.diff(np.concatenate(([0], inner, [len(values)])))
+    return edges, counts
+
+
+def _build_groups(column: str):
+    def build(frame: pd.DataFrame):
+        df = pd.DataFrame({
+            "key": snapshot.normalize(frame[column]),
+            "price": frame["valact"],
+        }).dropna()
+        df = df.sort_values(["key", "price"], kind="mergesort")
+
+        groups = {}
+        for key, prices in df.groupby("key", sort=False)["price"]:
+            values = prices.to_numpy(dtype="float64")
+            groups[key] = {
+                "values": values,
+                "histogram": _histogram(values, DEFAULT_BINS),
+            }
+        return groups
+    return build
+
+
+def group_entry(engine: Engine, group: str, key: str):
+    """Presorted valact array and default histogram for one city/neighborhood, None if it has no priced parcels."""
+    column = GROUP_COLUMNS[group]
+    groups = snapshot.derived(engine, f"distributions:{group}", _build_groups(column))
+    return groups.get(snapshot.normalize_key(key))
+
+
+def quantiles(values: np.ndarray, percentiles):
+    """Linear interpolated percentiles of a sorted array (matches np.percentile) without resorting."""
+    pos = np.asarray(percentiles, dtype="float64") / 100.0 * (len(values) - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.ceil(pos).astype(int)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def percentile_rank(values: np.ndarray, price: float):
+    """Percent of the group valued at or below price."""
+    return float(np.searchsorted(values, price, side="right") / len(values) * 100)
+
+
+def parse_percentiles(text: str):
+    """Parses a comma separated percentile list like '10,50,90', raising ValueError on bad input."""
+    percentiles = [float(p) for p in text.split(",") if p.strip()]
+    if not percentiles or any(p < 0 or p > 100 for p in percentiles):
+        raise ValueError("Percentiles must be numbers between 0 and 100.")
+    return percentiles
+
+
+def group_distribution(
+    engine: Engine,
+    group: str,
+    key: str,
+    price: float or None,
+    percentiles=DEFAULT_PERCENTILES,
+    bins: int = DEFAULT_BINS,
+):
+    """Percentiles, subject percentile rank and value histogram for a comps group."""
+    entry = group_entry(engine, group, key)
+    if entry is None:
+        return None
+
+    values = entry["values"]
+    if bins == DEFAULT_BINS:
+        edges, counts = entry["histogram"]
+    else:
+        edges, counts = _histogram(values, bins)
+
+    return {
+        "percentiles": {
+            f"p{p:g}": float(v) for p, v in zip(percentiles, quantiles(values, percentiles))
+        },
+        "price_percentile_rank": percentile_rank(values, price) if price is not None else None,
+        "histogram": {
+            "bin_edges": [float(e) for e in edges],
+            "counts": [int(c) for c in counts],
+        },
+    }
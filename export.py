@@ -0,0 +1,194 @@
+from sqlalchemy import Engine, inspect, text, types
+import io
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+
+import lazy
+
+import query
+import snapshot
+
+# the CSV reader and parquet writer only load when an export runs
+pa_csv = lazy.module("pyarrow.csv")
+pq = lazy.module("pyarrow.parquet")
+
+FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+CHUNK_ROWS = 50_000
+CSV_BLOCK_BYTES = 4 << 20
+
+_table_columns = {}
+
+
+def _arrow_type(sql_type):
+    if isinstance(sql_type, types.Boolean):
+        return pa.bool_()
+    if isinstance(sql_type, types.Integer):
+        return pa.int64()
+    if isinstance(sql_type, (types.Float, types.Numeric)):
+        return pa.float64()
+    if isinstance(sql_type, types.DateTime):
+        return pa.timestamp("us")
+    if isinstance(sql_type, types.Date):
+        return pa.date32()
+    return pa.string()
+
+
+def table_columns(engine: Engine):
+    """Parcel table column name -> arrow type, reflected once per database."""
+    key = str(engine.url)
+    if key not in _table_columns:
+        schema = query.schema if engine.dialect.name != "sqlite" else None
+        columns = inspect(engine).get_columns(query.parcels, schema=schema)
+        _table_columns[key] = {c["name"]: _arrow_type(c["type"]) for c in columns}
+    return _table_columns[key]
+
+
+def export_schema(engine: Engine, columns: list or None):
+    """Arrow schema for the requested columns (all when None), raising ValueError for unknown ones."""
+    available = table_columns(engine)
+    columns = columns or list(available)
+    unknown = [c for c in columns if c not in available]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+    return pa.schema([(c, available[c]) for c in columns])
+
+
+def _select(engine: Engine, schema: pa.Schema, city, neighborhood, taxcls):
+    where = []
+    params = {}
+    if city:
+        where.append("UPPER(TRIM(prpctynam)) = UPPER(TRIM(%(city)s))")
+        params["city"] = city
+    if neighborhood:
+        where.append("UPPER(TRIM(nhdnam)) = UPPER(TRIM(%(neighborhood)s))")
+        params["neighborhood"] = neighborhood
+    if taxcls:
+        # prefix match, so taxcls=1 exports every residential class
+        where.append("taxcls LIKE %(taxcls)s || '%%'")
+        params["taxcls"] = taxcls
+    sql = f"""
+        SELECT {', '.join(f'"{name}"' for name in schema.names)}
+        FROM {snapshot.full_table(engine)}
+        {"WHERE " + " AND ".join(where) if where else ""}
+    """
+    return sql, params
+
+
+def _copy_batches(engine: Engine, sql: str, params: dict, schema: pa.Schema):
+    """
+    Postgres path: COPY ... TO STDOUT (CSV) written into a pipe by a worker thread and parsed
+    by pyarrow's streaming CSV reader straight into record batches, so no Python objects per row.
+    The pipe bounds memory: the COPY blocks while the client is slow.
+    """
+    read_fd, write_fd = os.pipe()
+    reader_file = os.fdopen(read_fd, "rb")
+    writer_file = os.fdopen(write_fd, "wb")
+    errors = []
+
+    def produce():
+        try:
+            raw = engine.raw_connection()
+            try:
+                cursor = raw.cursor()
+                select = cursor.mogrify(sql, params).decode()
+                cursor.copy_expert(f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER true)", writer_file)
+                cursor.close()
+            finally:
+                raw.close()
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            writer_file.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        reader = pa_csv.open_csv(
+            reader_file,
+            read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_BYTES),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=dict(zip(schema.names, schema.types)),
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False,
+                true_values=["t"],
+                false_values=["f"],
+            ),
+        )
+        for batch in reader:
+            yield batch
+    finally:
+        reader_file.close()
+        thread.join()
+    if errors and not isinstance(errors[0], BrokenPipeError):
+        raise errors[0]
+
+
+def _cursor_batches(engine: Engine, sql: str, params: dict, schema: pa.Schema, chunk_rows: int):
+    """Other databases: server-side cursor read in chunks, each chunk converted column-wise."""
+    if engine.dialect.paramstyle != "pyformat":
+        sql = sql.replace("%%", "%")
+        for name in params:
+            sql = sql.replace(f"%({name})s", f":{name}")
+        sql = text(sql)
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_rows) as conn:
+        for chunk in pd.read_sql(sql, conn, params=params, chunksize=chunk_rows):
+            yield pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False)
+
+
+def record_batches(engine: Engine, schema: pa.Schema, city=None, neighborhood=None, taxcls=None,
+                   chunk_rows: int = CHUNK_ROWS):
+    sql, params = _select(engine, schema, city, neighborhood, taxcls)
+    if engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2":
+        return _copy_batches(engine, sql, params, schema)
+    return _cursor_batches(engine, sql, params, schema, chunk_rows)
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink whose bytes are handed to the response as soon as a batch is written."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def stream_export(batches, schema: pa.Schema, fmt: str):
+    """Arrow IPC stream or Parquet (one row group per batch) bytes, produced batch by batch."""
+    sink = _Drain()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        write = writer.write_batch
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+    try:
+        for batch in batches:
+            if batch.num_rows:
+                write(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
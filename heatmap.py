@@ -0,0 +1,125 @@
+from sqlalchemy import Engine
+import numpy as np
+import pandas as pd
+
+import snapshot
+import utilities
+
+METRICS = ("totactval", "value_change", "turnover")
+SHAPES = ("square", "hex")
+# grids kept per snapshot, other cell sizes are binned per request
+STANDARD_CELLS = (500, 1000, 2640, 5280)
+MIN_CELL_FEET = 100
+TURNOVER_YEARS = 10
+SQRT3 = np.sqrt(3.0)
+
+
+def _arrays(frame: pd.DataFrame):
+    """Coordinates and metric inputs of every record with coordinates, as plain float arrays."""
+    located = frame["x_coord"].notna() & frame["y_coord"].notna()
+    df = frame[located]
+    return {
+        "x": df["x_coord"].to_numpy(),
+        "y": df["y_coord"].to_numpy(),
+        "totactval": df["totactval"].to_numpy(),
+        "pyrtotval": df["pyrtotval"].to_numpy(),
+        "last_sale": df["last_sale"].to_numpy(),
+    }
+
+
+def coordinate_arrays(engine: Engine):
+    return snapshot.derived(engine, "heatmap:arrays", _arrays)
+
+
+def _cells(x: np.ndarray, y: np.ndarray, shape: str, cell: float):
+    """Integer cell coordinates (i, j) and the cell centers. Hex cells are pointy-top, cell feet apart."""
+    if shape == "square":
+        i = np.floor(x / cell).astype("int64")
+        j = np.floor(y / cell).astype("int64")
+        return i, j, lambda i, j: ((i + 0.5) * cell, (j + 0.5) * cell)
+
+    size = cell / SQRT3
+    q = (SQRT3 / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    # cube rounding: round all three axes, then fix the one that moved furthest
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype("int64"), rr.astype("int64"), lambda i, j: (size * SQRT3 * (i + j / 2), size * 1.5 * j)
+
+
+def _grid(arrays: dict, metric: str, shape: str, cell: float):
+    i, j, centers = _cells(arrays["x"], arrays["y"], shape, cell)
+    if len(i) == 0:
+        return {"i": [], "j": [], "lat": [], "lon": [], "count": [], "value": [], "total": []}
+    i0, j0 = i.min(), j.min()
+    width = int(j.max() - j0) + 1
+    # compacted to the occupied cells, a stray far-off coordinate must not size the arrays by the bounding box
+    occupied, ids = np.unique((i - i0) * width + (j - j0), return_inverse=True)
+    size = len(occupied)
+    count = np.bincount(ids, minlength=size)
+
+    if metric == "totactval":
+        known = ~np.isnan(arrays["totactval"])
+        total = np.bincount(ids[known], weights=arrays["totactval"][known], minlength=size)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            value = total / np.bincount(ids[known], minlength=size)
+    elif metric == "value_change":
+        paired = ~np.isnan(arrays["totactval"]) & ~np.isnan(arrays["pyrtotval"])
+        total = np.bincount(ids[paired], weights=(arrays["totactval"] - arrays["pyrtotval"])[paired], minlength=size)
+        prior = np.bincount(ids[paired], weights=arrays["pyrtotval"][paired], minlength=size)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            value = np.where(prior > 0, total / prior * 100, np.nan)
+    else:
+        cutoff = np.datetime64(pd.Timestamp.today().normalize() - pd.DateOffset(years=TURNOVER_YEARS))
+        sold = arrays["last_sale"] >= cutoff
+        total = np.bincount(ids[sold], minlength=size).astype("float64")
+        value = total / np.maximum(count, 1) * 100
+
+    cell_i = occupied // width + i0
+    cell_j = occupied % width + j0
+    cx, cy = centers(cell_i, cell_j)
+    lon, lat = utilities.transformer(utilities.PARCEL_CRS, utilities.WGS84).transform(cx, cy)
+
+    def compact(values, digits):
+        values = np.round(values, digits)
+        return [None if np.isnan(v) else v for v in values.tolist()]
+
+    return {
+        "i": cell_i.tolist(),
+        "j": cell_j.tolist(),
+        "lat": np.round(lat, 6).tolist(),
+        "lon": np.round(lon, 6).tolist(),
+        "count": count.tolist(),
+        "value": compact(value, 2),
+        "total": compact(total, 2),
+    }
+
+
+def heatmap(engine: Engine, metric: str = "totactval", cell_feet: float = 1000, shape: str = "square"):
+    """
+    Records binned into square or hex cells, as parallel arrays over the occupied cells.
+    value is the cell's average totactval, value change % or % of records sold in the last
+    TURNOVER_YEARS; total is the matching sum (value, dollar change or records sold).
+    """
+    if cell_feet in STANDARD_CELLS:
+        # turnover counts sales since a date relative to today, so its grids are kept per day
+        stamp = pd.Timestamp.today().date() if metric == "turnover" else None
+        cells = snapshot.derived(engine, f"heatmap:{metric}:{shape}:{cell_feet:g}",
+                                 lambda frame: _grid(coordinate_arrays(engine), metric, shape, cell_feet), stamp)
+    else:
+        cells = _grid(coordinate_arrays(engine), metric, shape, cell_feet)
+    return {"metric": metric, "shape": shape, "cell_feet": cell_feet, "crs": utilities.PARCEL_CRS,
+            "cells": len(cells["i"]), **cells}
+
+
+def warm(engine: Engine):
+    """Precomputes every metric and shape at the standard resolutions."""
+    for metric in METRICS:
+        for shape in SHAPES:
+            for cell in STANDARD_CELLS:
+                heatmap(engine, metric, cell, shape)
@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from datetime import date, datetime
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request
+from fastapi.responses import Response
+import gzip
+import hashlib
+
+import snapshot
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always offered
+    brotli = None
+
+# routes whose answers only change when the dataset version does
+CACHED_PATHS = ("/funfacts/", "/turnover/", "/value-change/neighborhood", "/value-change/parcels/", "/heatmap")
+MAX_ENTRIES = 128
+MIN_COMPRESS_BYTES = 512
+
+# (etag) -> {"body": identity bytes, "headers": {...}, "encoded": {encoding: bytes}}, most recently used last
+_entries = OrderedDict()
+_entries_version = None
+
+
+def _cacheable(request: Request):
+    path = request.url.path
+    return request.method == "GET" and any(path.startswith(p) for p in CACHED_PATHS)
+
+
+def _date_relative(request: Request):
+    """Answers counting sales in a window ending today, which also change when the date does."""
+    path = request.url.path
+    return path.startswith("/turnover/") or (path.startswith("/heatmap") and
+                                             request.query_params.get("metric") == "turnover")
+
+
+def make_etag(fingerprint: str, request: Request):
+    """Weak ETag from the snapshot's content hash (so every worker agrees), the URL and, for date relative routes, the day."""
+    key = f"{request.url.path}?{request.url.query}"
+    if _date_relative(request):
+        key += f"@{date.today().isoformat()}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return f'W/"{fingerprint}-{digest}"'
+
+
+def _last_modified(request: Request):
+    """The snapshot's load time, or the start of today for date relative routes if that is later."""
+    modified = snapshot.last_modified()
+    if _date_relative(request):
+        modified = max(modified, datetime.combine(date.today(), datetime.min.time()).timestamp())
+    return modified
+
+
+def negotiate(accept_encoding: str):
+    """Picks br or gzip from an Accept-Encoding header, honouring q=0, else identity."""
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if offered.get(encoding, offered.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+def _compress(body: bytes, encoding: str):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _not_modified(request: Request, etag: str, modified: float):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _remember(etag: str, version: str, body: bytes, headers: dict):
+    global _entries_version
+    if _entries_version != version:
+        _entries.clear()
+        _entries_version = version
+    # the profiler runs inside this middleware, its id belongs to the one response it sampled
+    headers = {k: v for k, v in headers.items() if k.lower() != "x-profile-id"}
+    _entries[etag] = {"body": body, "headers": headers, "encoded": {}}
+    while len(_entries) > MAX_ENTRIES:
+        _entries.popitem(last=False)
+
+
+def _respond(entry: dict, encoding: str):
+    headers = dict(entry["headers"])
+    body = entry["body"]
+    if encoding != "identity" and len(body) >= MIN_COMPRESS_BYTES:
+        if encoding not in entry["encoded"]:
+            entry["encoded"][encoding] = _compress(body, encoding)
+        body = entry["encoded"][encoding]
+        headers["content-encoding"] = encoding
+    return Response(content=body, status_code=200, headers=headers)
+
+
+async def conditional_get(request: Request, call_next):
+    """
+    ETag/Last-Modified from the snapshot's content hash for the polled routes: matching
+    If-None-Match/If-Modified-Since gets a 304 without running the endpoint, and bodies
+    are kept (with their gzip/br encodings) for the most recently requested URLs.
+    """
+    if not _cacheable(request):
+        return await call_next(request)
+
+    def validators(version: str):
+        return {
+            "etag": make_etag(version, request),
+            "last-modified": formatdate(_last_modified(request), usegmt=True),
+            "cache-control": "no-cache",
+            "vary": "Accept-Encoding",
+        }
+
+    version = snapshot.fingerprint()
+    if version is None:
+        # no content hash to build a validator on yet (nothing loaded, or reloading after a write)
+        return await call_next(request)
+    headers = validators(version)
+    if _not_modified(request, headers["etag"], _last_modified(request)):
+        return Response(status_code=304, headers=headers)
+
+    encoding = negotiate(request.headers.get("accept-encoding", ""))
+    entry = _entries.get(headers["etag"]) if _entries_version == version else None
+    if entry is not None:
+        _entries.move_to_end(headers["etag"])
+        return _respond(entry, encoding)
+
+    response = await call_next(request)
+    if response.status_code != 200:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-encoding")}
+
+    # only keep the body if nothing changed the data while the endpoint ran
+    entry = {"body": body, "headers": headers, "encoded": {}}
+    if snapshot.fingerprint() == version:
+        headers.update(validators(version))
+        _remember(headers["etag"], version, body, headers)
+        # shares the stored encodings, but keeps this response's own headers
+        entry = {**_entries[headers["etag"]], "headers": headers}
+    return _respond(entry, encoding)
@@ -0,0 +1,227 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import Engine
+import hashlib
+import inspect
+import json
+import os
+import socket
+import threading
+import time
+
+import pandas as pd
+
+import query
+
+# analyses that can be submitted as jobs, by name
+ANALYSES = {
+    fn.__name__: fn for fn in [
+        query.turnover_neighborhood,
+        query.turnover_subdivision,
+        query.value_change_by_neighborhood,
+        query.top_value_change_parcels,
+        query.occupancy_counts_city,
+        query.property_type_counts_city,
+        query.most_valuable_streets,
+        query.most_valuable_street_types,
+        query.address_by_name,
+        query.city_comps,
+        query.neighborhood_comps,
+        query.property_distance_comps,
+        query.neighbors_address,
+        query.neighbors_parcel_pin,
+    ]
+}
+
+JOBS_DIR = os.getenv("JOBS_DIR", "./jobs")
+TTL_SECONDS = float(os.getenv("JOBS_TTL_SECONDS", "3600"))
+WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+# queued/running jobs have their heartbeat saved this often, another process takes one as abandoned
+# once its heartbeat is STALE_SECONDS old or its owner's pid is gone
+HEARTBEAT_SECONDS = float(os.getenv("JOBS_HEARTBEAT_SECONDS", "10"))
+STALE_SECONDS = float(os.getenv("JOBS_STALE_SECONDS", "60"))
+
+_lock = threading.Lock()
+# jobs this process owns, others are read from disk every time since their owner keeps updating them
+_jobs = {}
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="job")
+_heartbeat = None
+_owner = {"host": socket.gethostname(), "pid": os.getpid()}
+
+
+def _paths(job_id: str):
+    return os.path.join(JOBS_DIR, f"{job_id}.json"), os.path.join(JOBS_DIR, f"{job_id}.result.json")
+
+
+def _bind(name: str, params: dict):
+    """Validated parameters with defaults applied (engine left out), raising ValueError on bad input."""
+    fn = ANALYSES.get(name)
+    if fn is None:
+        raise ValueError(f"Unknown analysis '{name}'. Please provide one of {', '.join(ANALYSES)}.")
+    if "engine" in params:
+        raise ValueError("engine is not a parameter.")
+    try:
+        bound = inspect.signature(fn).bind(None, **params)
+    except TypeError as e:
+        raise ValueError(str(e))
+    bound.apply_defaults()
+    return {k: v for k, v in bound.arguments.items() if k != "engine"}
+
+
+def job_id(name: str, params: dict):
+    """Same analysis with the same (defaulted) parameters always maps to the same job."""
+    canonical = json.dumps([name, params], sort_keys=True, default=str)
+    return hashlib.sha1(canonical.encode()).hexdigest()[:20]
+
+
+def _save(job: dict):
+    meta_path, _ = _paths(job["id"])
+    tmp = f"{meta_path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(job, f)
+    os.replace(tmp, meta_path)
+
+
+def _load(job_id: str):
+    meta_path, _ = _paths(job_id)
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _beat():
+    """Heartbeat thread: re-saves this process's unfinished jobs so other workers can tell they are alive."""
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        with _lock:
+            for job in _jobs.values():
+                if job["status"] in ("queued", "running"):
+                    job["heartbeat"] = time.time()
+                    _save(job)
+
+
+def _start_heartbeat():
+    global _heartbeat
+    if _heartbeat is None:
+        _heartbeat = threading.Thread(target=_beat, name="job-heartbeat", daemon=True)
+        _heartbeat.start()
+
+
+def _abandoned(job: dict):
+    """Whether an unfinished job owned by another process has lost its owner."""
+    if time.time() - (job.get("heartbeat") or job["submitted"]) > STALE_SECONDS:
+        return True
+    owner = job.get("owner") or {}
+    if owner.get("host") != _owner["host"]:
+        return False
+    try:
+        os.kill(owner["pid"], 0)
+    except ProcessLookupError:
+        return True
+    except (KeyError, TypeError, PermissionError):
+        return False
+    return False
+
+
+def _expired(job: dict):
+    return job["finished"] is not None and time.time() - job["finished"] > TTL_SECONDS
+
+
+def _remove(job_id: str):
+    _jobs.pop(job_id, None)
+    for path in _paths(job_id):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _write_result(result, path: str):
+    tmp = f"{path}.tmp"
+    if isinstance(result, pd.DataFrame):
+        result.to_json(tmp, orient="records")
+        rows = len(result)
+    else:
+        with open(tmp, "w") as f:
+            json.dump(result, f, default=str)
+        rows = None
+    os.replace(tmp, path)
+    return rows
+
+
+def _run(engine: Engine, job: dict):
+    with _lock:
+        job["status"] = "running"
+        job["started"] = job["heartbeat"] = time.time()
+        _save(job)
+    try:
+        result = ANALYSES[job["name"]](engine, **job["params"])
+        rows = _write_result(result, _paths(job["id"])[1])
+        update = {"status": "done", "rows": rows}
+    except Exception as e:
+        update = {"status": "failed", "error": str(e)}
+    with _lock:
+        job.update(update, finished=time.time())
+        _save(job)
+
+
+def _lookup(job_id: str):
+    """Job by id from memory or disk, dropping it if expired. Caller holds _lock."""
+    job = _jobs.get(job_id)
+    if job is None:
+        job = _load(job_id)
+        if job is None:
+            return None
+        if job["status"] in ("queued", "running") and _abandoned(job):
+            # the process that had it died (or was restarted) before finishing it
+            job.update(status="failed", error="Interrupted by a restart.", finished=time.time())
+            _save(job)
+    if _expired(job):
+        _remove(job_id)
+        return None
+    return job
+
+
+def get(job_id: str):
+    """Job status dict, None if unknown or its result has expired."""
+    with _lock:
+        job = _lookup(job_id)
+        return dict(job) if job is not None else None
+
+
+def submit(engine: Engine, name: str, params: dict or None = None):
+    """
+    Queues an analysis on the worker pool and returns its status. A submission matching a queued,
+    running or unexpired finished job returns that job instead; failed jobs are run again.
+    """
+    params = _bind(name, params or {})
+    new_id = job_id(name, params)
+    purge()
+    with _lock:
+        existing = _lookup(new_id)
+        if existing is not None and existing["status"] != "failed":
+            return dict(existing)
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        now = time.time()
+        job = {"id": new_id, "name": name, "params": params, "status": "queued", "owner": _owner,
+               "submitted": now, "heartbeat": now, "started": None, "finished": None, "rows": None, "error": None}
+        _jobs[new_id] = job
+        _save(job)
+        _start_heartbeat()
+    _executor.submit(_run, engine, job)
+    return dict(job)
+
+
+def result_path(job_id: str):
+    return _paths(job_id)[1]
+
+
+def purge():
+    """Removes finished jobs (and their result files) older than the TTL."""
+    if not os.path.isdir(JOBS_DIR):
+        return
+    for name in os.listdir(JOBS_DIR):
+        if name.endswith(".json") and not name.endswith(".result.json"):
+            with _lock:
+                _lookup(name[:-len(".json")])
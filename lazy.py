@@ -0,0 +1,25 @@
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is first used, then imports it and takes on its namespace."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_target"] = name
+
+    def __getattr__(self, attr: str):
+        module = importlib.import_module(self.__dict__["_lazy_target"])
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def module(name: str):
+    """
+    The named module if it is already imported, otherwise a stand-in that imports it on first use,
+    so heavy optional dependencies (plotting, projections, parquet) only load on the paths that need them.
+    Only attribute access is deferred: use it for `import x` style imports, not `from x import y`.
+    """
+    return sys.modules.get(name) or LazyModule(name)
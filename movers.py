@@ -0,0 +1,68 @@
+from sqlalchemy import Engine
+import numpy as np
+import pandas as pd
+
+import snapshot
+
+BY = ("abs", "pct")
+DIRECTIONS = ("up", "down", "any")
+
+
+class ChangeIndex:
+    """Per-record value change arrays (records with both values known), with row ids grouped by city."""
+
+    def __init__(self, frame: pd.DataFrame):
+        current = frame["totactval"].to_numpy()
+        prior = frame["pyrtotval"].to_numpy()
+        known = ~np.isnan(current) & ~np.isnan(prior)
+        self.frame = frame
+        self.positions = np.flatnonzero(known)
+        self.current = current[known]
+        self.prior = prior[known]
+        self.change = self.current - self.prior
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.pct = np.where(self.prior > 0, self.change / self.prior * 100, np.nan)
+        self.taxcls = frame["taxcls"].fillna("").astype(str).to_numpy()[known].astype("U")
+        cities = snapshot.normalize(frame["prpctynam"]).fillna("").to_numpy()[known]
+        self.cities = pd.Series(np.arange(len(cities))).groupby(cities).indices
+
+    def top(self, k: int, by: str = "abs", direction: str = "up", city: str or None = None,
+            taxcls: str or None = None):
+        """Ids of the k largest movers, only the k selected are sorted (argpartition does the rest)."""
+        if city:
+            ids = self.cities.get(snapshot.normalize_key(city), np.empty(0, dtype="int64"))
+        else:
+            ids = np.arange(len(self.change))
+        if taxcls:
+            ids = ids[np.char.startswith(self.taxcls[ids], taxcls)]
+
+        values = (self.change if by == "abs" else self.pct)[ids]
+        score = {"up": values, "down": -values, "any": np.abs(values)}[direction]
+        keep = ~np.isnan(score)
+        ids, score = ids[keep], score[keep]
+        if len(ids) > k:
+            selected = np.argpartition(-score, k - 1)[:k]
+            ids, score = ids[selected], score[selected]
+        return ids[np.argsort(-score, kind="stable")]
+
+    def rows(self, ids):
+        records = self.frame.iloc[self.positions[ids]]
+        result = pd.DataFrame({
+            "objectid": records["objectid"].to_numpy(),
+            "pin": records["pin"].to_numpy(),
+            "property_address": records["prpaddress"].to_numpy(),
+            "property_city": records["prpctynam"].to_numpy(),
+            "taxcls": records["taxcls"].to_numpy(),
+            "prior_value": self.prior[ids],
+            "current_value": self.current[ids],
+            "value_change": self.change[ids],
+            "value_change_pct": np.round(self.pct[ids], 2),
+        })
+        return result.astype(object).where(result.notna(), None).to_dict(orient="records")
+
+
+def top_movers(engine: Engine, k: int = 10, by: str = "abs", direction: str = "up", city: str or None = None,
+               taxcls: str or None = None):
+    """Parcels with the largest change from pyrtotval to totactval, in dollars (abs) or percent (pct)."""
+    index = snapshot.derived(engine, "movers", ChangeIndex)
+    return index.rows(index.top(k, by, direction, city, taxcls))
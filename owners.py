@@ -0,0 +1,122 @@
+from sqlalchemy import Engine
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import snapshot
+
+OWNER_COLUMNS = ["ownnam", "ownnam2", "ownnam3"]
+RANKINGS = {"parcels": ["parcels", "value"], "value": ["value", "parcels"]}
+
+
+def _clean(values: pd.Series):
+    """Upper case, punctuation dropped (so 'SMITH, JOHN' == 'SMITH JOHN'), single spaced."""
+    text = snapshot.normalize(values).fillna("")
+    return text.str.replace(r"[^A-Z0-9& ]", " ", regex=True).str.replace(r"\s+", " ", regex=True).str.strip()
+
+
+def owner_identity(names, mailing: str):
+    """Owner names in any order plus the normalized mailing address, None if there are no names."""
+    names = sorted({n for n in names if n})
+    if not names:
+        return None
+    return "|".join(names) + "#" + mailing
+
+
+def owner_id(identity: str):
+    return hashlib.sha1(identity.encode()).hexdigest()[:16]
+
+
+class OwnerIndex:
+    """Per-owner parcel counts, value totals and city breakdown, with rankings presorted per city."""
+
+    def __init__(self, frame: pd.DataFrame):
+        names = [_clean(frame[col]) for col in OWNER_COLUMNS]
+        mailing = snapshot._normalized_address(frame["mailstrnbr"], frame["mailstrnam"], frame["mailctynam"], frame["mailzip5"])
+        mailing = mailing.str.replace(r"[^A-Z0-9 ]", " ", regex=True).str.replace(r"\s+", " ", regex=True).str.strip()
+        identities = [owner_identity(row[:3], row[3]) for row in zip(*names, mailing)]
+
+        codes, uniques = pd.factorize(pd.Series(identities, index=frame.index, dtype=object))
+        self.ids = [owner_id(identity) for identity in uniques]
+        self.codes = {oid: code for code, oid in enumerate(self.ids)}
+        self.frame = frame
+        # records with no owner names have code -1; groupby indices count within the named records,
+        # so map them back to frame positions
+        named = np.flatnonzero(codes >= 0)
+        self.positions = {code: named[at] for code, at in pd.Series(named).groupby(codes[named]).indices.items()}
+
+        df = pd.DataFrame({
+            "owner": codes,
+            "pin": frame["pin"].to_numpy(),
+            "city": snapshot.normalize(frame["prpctynam"]).to_numpy(),
+            "value": frame["totactval"].fillna(0).to_numpy(),
+        })
+        df = df[df["owner"] >= 0]
+
+        totals = df.groupby("owner").agg(parcels=("pin", "nunique"), records=("pin", "size"), value=("value", "sum"))
+        first = uniques.map(lambda identity: identity.split("#", 1))
+        totals["owner_id"] = [self.ids[code] for code in totals.index]
+        totals["names"] = [first[code][0].split("|") for code in totals.index]
+        totals["mailing_address"] = [first[code][1] or None for code in totals.index]
+        self.totals = totals
+
+        by_city = df.groupby(["owner", "city"], dropna=False).agg(parcels=("pin", "nunique"), value=("value", "sum")).reset_index()
+        self.by_city = by_city
+        self.rankings = {}
+        for by, order in RANKINGS.items():
+            ranked = totals.sort_values(order, ascending=False, kind="mergesort")
+            self.rankings[(None, by)] = ranked.index.to_numpy()
+            ranked_city = by_city.sort_values(order, ascending=False, kind="mergesort")
+            for city, group in ranked_city.groupby("city", sort=False):
+                self.rankings[(city, by)] = group[["owner", "parcels", "value"]].to_numpy()
+
+    def _summary(self, code: int, parcels: int, value: float):
+        row = self.totals.loc[code]
+        return {
+            "owner_id": row["owner_id"],
+            "names": row["names"],
+            "mailing_address": row["mailing_address"],
+            "parcels": int(parcels),
+            "total_value": float(value),
+        }
+
+    def top(self, city: str or None = None, k: int = 10, by: str = "parcels"):
+        if city is None:
+            codes = self.rankings[(None, by)][:k]
+            return [self._summary(code, self.totals.at[code, "parcels"], self.totals.at[code, "value"]) for code in codes]
+        ranked = self.rankings.get((snapshot.normalize_key(city), by))
+        if ranked is None:
+            return []
+        return [self._summary(int(code), parcels, value) for code, parcels, value in ranked[:k]]
+
+    def portfolio(self, oid: str):
+        code = self.codes.get(oid)
+        if code is None:
+            return None
+        row = self.totals.loc[code]
+        cities = self.by_city[self.by_city["owner"] == code].sort_values("parcels", ascending=False, kind="mergesort")
+        records = self.frame.iloc[self.positions[code]]
+        parcels = records[["pin", "objectid", "prpaddress", "prpctynam", "prpzip5", "totactval"]].rename(columns={
+            "prpaddress": "address", "prpctynam": "city", "prpzip5": "zip", "totactval": "market_value"})
+        return {
+            **self._summary(code, row["parcels"], row["value"]),
+            "records": int(row["records"]),
+            "cities": [{"city": c, "parcels": int(p), "total_value": float(v)}
+                       for c, p, v in cities[["city", "parcels", "value"]].itertuples(index=False)],
+            "parcels": parcels.astype(object).where(parcels.notna(), None).to_dict(orient="records"),
+        }
+
+
+def index(engine: Engine):
+    return snapshot.derived(engine, "owners", OwnerIndex)
+
+
+def top_owners(engine: Engine, city: str or None = None, k: int = 10, by: str = "parcels"):
+    """Owners with the most parcels (or value), county wide or within a city."""
+    return index(engine).top(city, k, by)
+
+
+def portfolio(engine: Engine, oid: str):
+    """Totals, city breakdown and parcel list for an owner id from top_owners, None if unknown."""
+    return index(engine).portfolio(oid)
@@ -0,0 +1,35 @@
+import base64
+import json
+
+
+def _plain(value):
+    """numpy scalars to python, Decimal and anything else exact as a string."""
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def encode_cursor(values):
+    """Opaque keyset cursor holding the sort key of the last row on a page."""
+    raw = json.dumps(list(values), default=_plain, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(token: str, size: int):
+    """Sort key back out of a cursor, raising ValueError if it was not made by encode_cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor.")
+    return tuple(values)
+
+
+def next_cursor(df, limit: int or None, columns):
+    """Cursor for the page after df, None when df is the last page."""
+    if limit is None or len(df) < limit or len(df) == 0:
+        return None
+    last = df.iloc[-1]
+    return encode_cursor([last[c] for c in columns])
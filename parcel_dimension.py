@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+from sqlalchemy import Engine, inspect, text
+import zlib
+
+import query
+import snapshot
+
+# one row per pin: lowest objectid record's address/city/zip/pindesc and the centroid of all its records
+INDEXES = {"pin": "UNIQUE INDEX", "prpzip5": "INDEX", "prpctynam": "INDEX", "objectid": "INDEX"}
+# the parcel columns the dimension is built from, hashed to tell when it needs rebuilding
+SOURCE_COLUMNS = ["pin", "objectid", "prpaddress", "prpctynam", "prpzip5", "pindesc", "x_coord", "y_coord"]
+
+# digest each database's dimension was built from, where it cannot be kept as a table comment (sqlite)
+_built = {}
+
+
+def _table(engine: Engine, name: str):
+    if engine.dialect.name == "sqlite":
+        return f'"{name}"'
+    return f'"{query.schema}"."{name}"'
+
+
+def exists(engine: Engine):
+    schema = query.schema if engine.dialect.name != "sqlite" else None
+    return inspect(engine).has_table(query.parcel_pins, schema=schema)
+
+
+def built_from(engine: Engine):
+    """Digest of the parcel data the live dimension was built from, None if unknown (or built by ingest)."""
+    if engine.dialect.name != "postgresql":
+        return _built.get(str(engine.url))
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT obj_description(to_regclass(:name), 'pg_class')"),
+                            {"name": f'"{query.schema}"."{query.parcel_pins}"'}).scalar()
+
+
+@contextmanager
+def _build_lock(engine: Engine):
+    """Session advisory lock on Postgres, so two workers (or ingest and a worker) never build at once."""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    key = zlib.crc32(f"{query.schema}.{query.parcel_pins}".encode())
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": key})
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+            conn.commit()
+
+
+def build(engine: Engine, digest: str or None = None):
+    """
+    (Re)builds the parcel dimension beside the live one and swaps it in, so neighbor queries
+    never see it missing or half built. digest (see sync) is recorded with it. Returns the number
+    of pins, or None when another worker built it from the same digest while this one waited.
+    """
+    with _build_lock(engine):
+        if digest is not None and exists(engine) and built_from(engine) == digest:
+            return None
+        return _build(engine, digest)
+
+
+def _build(engine: Engine, digest: str or None):
+    name = query.parcel_pins
+    building = f"{name}_build"
+    source = snapshot.full_table(engine)
+    schema = f'"{query.schema}".' if engine.dialect.name != "sqlite" else ""
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {_table(engine, building)}"))
+        conn.execute(text(f"CREATE TABLE {_table(engine, building)} AS {query.PARCEL_DIMENSION.format(source=source)}"))
+        if engine.dialect.name != "sqlite":
+            for column, kind in INDEXES.items():
+                conn.execute(text(f'CREATE {kind} "{name}_{column}_build" ON {_table(engine, building)} ({column})'))
+        count = conn.execute(text(f"SELECT COUNT(*) FROM {_table(engine, building)}")).scalar()
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {_table(engine, name)}"))
+        conn.execute(text(f'ALTER TABLE {_table(engine, building)} RENAME TO "{name}"'))
+        for column, kind in INDEXES.items():
+            if engine.dialect.name == "sqlite":
+                # sqlite cannot rename indexes, build them under their final names after the swap
+                conn.execute(text(f'CREATE {kind} "{name}_{column}" ON {_table(engine, name)} ({column})'))
+            else:
+                conn.execute(text(f'ALTER INDEX {schema}"{name}_{column}_build" RENAME TO "{name}_{column}"'))
+        if engine.dialect.name == "postgresql":
+            # digests are hex, safe to inline (COMMENT takes no bind parameters)
+            conn.execute(text(f"COMMENT ON TABLE {_table(engine, name)} IS " + (f"'{digest}'" if digest else "NULL")))
+    _built[str(engine.url)] = digest
+    return count
+
+
+def _digest(frame):
+    return snapshot._digest(frame[SOURCE_COLUMNS])
+
+
+def sync(engine: Engine, source: Engine or None = None):
+    """
+    Builds the parcel dimension on engine (the writer) when it is missing or was built from other parcel
+    data than the snapshot loaded from source holds. Warm-up runs this at start and on every refresh, so
+    loads made outside ingest are picked up; mailing edits do not touch the dimension's columns.
+    """
+    digest = snapshot.derived(source or engine, "parcel_dimension:digest", _digest)
+    if exists(engine) and built_from(engine) == digest:
+        return None
+    return build(engine, digest)
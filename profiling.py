@@ -0,0 +1,194 @@
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi import Request
+from fastapi.routing import APIRoute
+import functools
+import hmac
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+# X-Profile: 1 and the admin routes only work with X-Profile-Token equal to this, unset disables them
+TOKEN = os.getenv("PROFILE_TOKEN")
+INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+# folded stacks are also written here as <id>.folded when set
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+
+# fraction of requests (under path, when given) profiled without asking, changed at runtime by configure()
+_settings = {"sample_rate": float(os.getenv("PROFILE_SAMPLE_RATE", "0")), "path": None}
+
+# profile of the request being served, read by the endpoint wrapper to register its thread
+_current = ContextVar("profile", default=None)
+
+_lock = threading.Condition()
+_active = set()
+_profiles = deque(maxlen=KEEP)
+_sampler = None
+_counts = {"profiled": 0, "samples": 0}
+
+
+class Profile:
+    """Stack samples of the threads running one request, counted per folded stack."""
+
+    def __init__(self, method: str, path: str, reason: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started = time.time()
+        self.duration_ms = None
+        self.threads = set()
+        self.stacks = Counter()
+
+    def folded(self):
+        """Brendan Gregg's folded format (root first, ';' separated, then the sample count), as flamegraph.pl and speedscope read it."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self):
+        return {"id": self.id, "method": self.method, "path": self.path, "reason": self.reason,
+                "started": self.started, "duration_ms": self.duration_ms, "samples": sum(self.stacks.values())}
+
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _sample():
+    """Sampler thread: sleeps on the condition while nothing is profiled, so it costs nothing when idle."""
+    while True:
+        with _lock:
+            while not _active:
+                _lock.wait()
+            profiles = list(_active)
+        frames = sys._current_frames()
+        for profile in profiles:
+            for thread in list(profile.threads):
+                frame = frames.get(thread)
+                if frame is not None:
+                    profile.stacks[_fold(frame)] += 1
+                    _counts["samples"] += 1
+        del frames
+        time.sleep(INTERVAL_SECONDS)
+
+
+def _start(profile: Profile):
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample, name="profiler", daemon=True)
+            _sampler.start()
+        _active.add(profile)
+        _lock.notify()
+
+
+def _finish(profile: Profile):
+    with _lock:
+        _active.discard(profile)
+        profile.duration_ms = round((time.time() - profile.started) * 1000, 3)
+        _profiles.append(profile)
+        _counts["profiled"] += 1
+    if PROFILE_DIR:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, f"{profile.id}.folded"), "w") as f:
+            f.write(profile.folded())
+
+
+@contextmanager
+def _registered():
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    thread = threading.get_ident()
+    profile.threads.add(thread)
+    try:
+        yield
+    finally:
+        profile.threads.discard(thread)
+
+
+def _traced(endpoint):
+    """Endpoint wrapper that puts the thread running it (threadpool or event loop) on the request's profile."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            with _registered():
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            with _registered():
+                return endpoint(*args, **kwargs)
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """Route class for the app's router, so every endpoint can be sampled when its request is profiled."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _traced(endpoint), **kwargs)
+
+
+def authorized(request: Request):
+    supplied = request.headers.get("X-Profile-Token")
+    return bool(TOKEN) and supplied is not None and hmac.compare_digest(supplied, TOKEN)
+
+
+def _reason(request: Request):
+    if request.headers.get("X-Profile") == "1" and authorized(request):
+        return "requested"
+    rate, path = _settings["sample_rate"], _settings["path"]
+    if rate and (path is None or request.url.path.startswith(path)) and random.random() < rate:
+        return "sampled"
+    return None
+
+
+async def profile_request(request: Request, call_next):
+    """Middleware: profiles requests asking for it (X-Profile: 1 with the token) or drawn by the sample rate."""
+    reason = _reason(request)
+    if reason is None:
+        return await call_next(request)
+    profile = Profile(request.method, request.url.path, reason)
+    token = _current.set(profile)
+    _start(profile)
+    try:
+        response = await call_next(request)
+    finally:
+        _current.reset(token)
+        _finish(profile)
+    response.headers["X-Profile-Id"] = profile.id
+    return response
+
+
+def configure(sample_rate: float, path: str or None = None):
+    """Admin toggle: profile this fraction of requests (0 turns sampling off), optionally only under path."""
+    if not 0 <= sample_rate <= 1:
+        raise ValueError("sample_rate must be between 0 and 1.")
+    _settings.update({"sample_rate": sample_rate, "path": path or None})
+    return status()
+
+
+def get(profile_id: str):
+    with _lock:
+        return next((p for p in _profiles if p.id == profile_id), None)
+
+
+def recent():
+    with _lock:
+        return [p.summary() for p in reversed(_profiles)]
+
+
+def status():
+    return {**_settings, "token_configured": bool(TOKEN), "interval_ms": INTERVAL_SECONDS * 1000, "active": len(_active),
+            **_counts}
@@ -0,0 +1,113 @@
+from sqlalchemy import Engine
+import numpy as np
+import pandas as pd
+
+import snapshot
+
+# rollup dimension -> snapshot column (taxcls_prefix is derived when the base cuboid is built)
+DIMENSIONS = {
+    "city": "prpctynam",
+    "neighborhood": "nhdnam",
+    "subdivision": "subnam",
+    "zip": "prpzip5",
+    "street_type": "prpstrtyp",
+    "taxcls_prefix": "taxcls",
+    "owner_company": "ownico",
+}
+
+VALUE_COLUMNS = ["totactval", "pyrtotval", "valact"]
+
+# how each stored measure rolls up from a finer cuboid to a coarser one
+MEASURES = {"rows": "sum", "current_value": "sum", "prior_value": "sum", "paired_rows": "sum"}
+for _col in VALUE_COLUMNS:
+    MEASURES.update({f"{_col}_sum": "sum", f"{_col}_count": "sum", f"{_col}_min": "min", f"{_col}_max": "max"})
+
+
+def dimension_frame(frame: pd.DataFrame):
+    """One column per rollup dimension, taxcls_prefix cut down to the class's first digit."""
+    df = pd.DataFrame({dim: frame[col] for dim, col in DIMENSIONS.items()})
+    df["taxcls_prefix"] = frame["taxcls"].str[:1]
+    return df
+
+
+def _base_cuboid(frame: pd.DataFrame):
+    """Finest lattice node, every dimension grouped; all other cuboids roll up from this one."""
+    df = dimension_frame(frame)
+    df["rows"] = 1
+    for col in VALUE_COLUMNS:
+        df[col] = frame[col]
+
+    # current/prior value only where both are known, like the value change query filters them
+    paired = frame["totactval"].notna() & frame["pyrtotval"].notna()
+    df["current_value"] = frame["totactval"].where(paired, 0.0)
+    df["prior_value"] = frame["pyrtotval"].where(paired, 0.0)
+    df["paired_rows"] = paired.astype("int64")
+
+    aggs = {"rows": "sum", "current_value": "sum", "prior_value": "sum", "paired_rows": "sum"}
+    named = {name: (name, how) for name, how in aggs.items()}
+    for col in VALUE_COLUMNS:
+        named[f"{col}_sum"] = (col, "sum")
+        named[f"{col}_count"] = (col, "count")
+        named[f"{col}_min"] = (col, "min")
+        named[f"{col}_max"] = (col, "max")
+    return df.groupby(list(DIMENSIONS), dropna=False).agg(**named).reset_index()
+
+
+def cuboid(engine: Engine, dims):
+    """Lattice node for a set of dimensions, rolled up from the base cuboid once per snapshot."""
+    dims = tuple(d for d in DIMENSIONS if d in dims)
+    base = snapshot.derived(engine, "rollup:base", _base_cuboid)
+    if len(dims) == len(DIMENSIONS):
+        return base
+
+    def build(frame):
+        if not dims:
+            return base.agg(MEASURES).to_frame().T
+        return base.groupby(list(dims), dropna=False).agg(MEASURES).reset_index()
+
+    return snapshot.derived(engine, f"rollup:{','.join(dims)}", build)
+
+
+def _with_averages(df: pd.DataFrame):
+    for col in VALUE_COLUMNS:
+        df[f"{col}_avg"] = df[f"{col}_sum"] / df[f"{col}_count"].replace(0, np.nan)
+    return df
+
+
+def aggregate(engine: Engine, group_by, filters: dict or None = None):
+    """
+    SUM/COUNT/MIN/MAX (and AVG) of totactval, pyrtotval and valact grouped by group_by.
+    filters maps dimension -> value and is matched like UPPER(TRIM(col)) = UPPER(TRIM(value)).
+    """
+    filters = filters or {}
+    unknown = [d for d in list(group_by) + list(filters) if d not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension(s): {', '.join(unknown)}")
+
+    df = cuboid(engine, set(group_by) | set(filters))
+    if filters:
+        mask = np.ones(len(df), dtype=bool)
+        for dim, value in filters.items():
+            mask &= (snapshot.normalize(df[dim]) == snapshot.normalize_key(value)).fillna(False).to_numpy()
+        df = df[mask]
+        if set(filters) - set(group_by):
+            if group_by:
+                df = df.groupby(list(group_by), dropna=False).agg(MEASURES).reset_index()
+            else:
+                df = df[list(MEASURES)].agg(MEASURES).to_frame().T
+
+    df = df[list(group_by) + list(MEASURES)].copy()
+    counts = [m for m in MEASURES if m.endswith("rows") or m.endswith("_count")]
+    df[counts] = df[counts].astype("int64")
+    return _with_averages(df)
+
+
+def parse_filters(filters):
+    """Parses repeated 'dimension:value' query arguments into a dict, raising ValueError on bad input."""
+    parsed = {}
+    for item in filters or []:
+        dim, sep, value = item.partition(":")
+        if not sep or not dim.strip():
+            raise ValueError(f"Filters must look like dimension:value, got '{item}'.")
+        parsed[dim.strip()] = value
+    return parsed
@@ -0,0 +1,182 @@
+from contextvars import ContextVar
+from fastapi import Request
+from sqlalchemy import Engine, create_engine, exc, text
+import itertools
+import os
+import threading
+import time
+import uuid
+
+# DB_WRITER_URL: database for mutations (defaults to the app's database)
+# DB_READER_URLS: comma separated replicas for reads, none means reads go to the writer
+HEALTH_SECONDS = float(os.getenv("DB_HEALTH_SECONDS", "10"))
+# how long a session's reads stay on the writer after it writes, should cover replica lag
+STICKY_SECONDS = float(os.getenv("DB_STICKY_SECONDS", "30"))
+SESSION_COOKIE = "db_session"
+
+# {"id", "new", "wrote"} for the request being served, shared with the endpoint's thread
+_session = ContextVar("db_session", default=None)
+
+
+async def track_session(request: Request, call_next):
+    """
+    Middleware: the session reads and writes are tracked under, X-Session-Id or else the session cookie.
+    A client with neither gets a fresh id, sent back as the cookie only if the request wrote.
+    """
+    known = request.headers.get("x-session-id") or request.cookies.get(SESSION_COOKIE)
+    session = {"id": known or uuid.uuid4().hex, "new": known is None, "wrote": False}
+    token = _session.set(session)
+    try:
+        response = await call_next(request)
+    finally:
+        _session.reset(token)
+    if session["new"] and session["wrote"]:
+        response.set_cookie(SESSION_COOKIE, session["id"], max_age=int(STICKY_SECONDS), httponly=True, samesite="lax")
+    return response
+
+
+def _session_id():
+    session = _session.get()
+    return session["id"] if session is not None else None
+
+
+def _connection_error(e: Exception):
+    """Errors that mean the database itself is unreachable, as opposed to a bad or cancelled query."""
+    if isinstance(e, exc.DBAPIError) and e.connection_invalidated:
+        return True
+    if isinstance(e, (exc.OperationalError, exc.InterfaceError)):
+        return getattr(e.orig, "pgcode", None) is None
+    return isinstance(e, exc.DisconnectionError)
+
+
+class _Replica:
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.healthy = True
+        self.checked = time.time()
+        self.failures = 0
+        self.reads = 0
+
+
+class Router:
+    """
+    One writer engine and any number of reader engines, each with its own pool. Reads go
+    round-robin to healthy readers and fail over to the next one (then the writer) on
+    connection errors; a session that just wrote reads from the writer for STICKY_SECONDS.
+    """
+
+    def __init__(self, writer: Engine, readers=()):
+        self.writer = writer
+        self.replicas = [_Replica(engine) for engine in readers]
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._writes = {}
+        self._writer_reads = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def engines(self):
+        return [self.writer] + [replica.engine for replica in self.replicas]
+
+    def note_write(self):
+        """Call after a mutation so this session reads its own write."""
+        session = _session.get()
+        if session is None:
+            return
+        session["wrote"] = True
+        now = time.time()
+        with self._lock:
+            self._writes = {s: t for s, t in self._writes.items() if now - t < STICKY_SECONDS}
+            self._writes[session["id"]] = now
+
+    def _sticky(self):
+        written = self._writes.get(_session_id())
+        return written is not None and time.time() - written < STICKY_SECONDS
+
+    def candidates(self):
+        """Engines to try for a read, in order: healthy readers from the round-robin position, then the writer."""
+        if self._sticky() or not self.replicas:
+            return [self.writer]
+        start = next(self._next)
+        n = len(self.replicas)
+        ordered = [self.replicas[(start + i) % n] for i in range(n)]
+        return [replica.engine for replica in ordered if replica.healthy] + [self.writer]
+
+    def reader(self):
+        return self.candidates()[0]
+
+    def _replica(self, engine: Engine):
+        return next((replica for replica in self.replicas if replica.engine is engine), None)
+
+    def mark_down(self, engine: Engine):
+        replica = self._replica(engine)
+        if replica is not None:
+            replica.healthy = False
+            replica.failures += 1
+
+    def read(self, run, fn, *args, **kwargs):
+        """run(fn, engine, *args, **kwargs) on the first engine from candidates() that is reachable."""
+        error = None
+        for engine in self.candidates():
+            try:
+                result = run(fn, engine, *args, **kwargs)
+            except Exception as e:
+                if not _connection_error(e):
+                    raise
+                self.mark_down(engine)
+                error = e
+                continue
+            replica = self._replica(engine)
+            if replica is not None:
+                replica.reads += 1
+            else:
+                self._writer_reads += 1
+            return result
+        raise error
+
+    def check(self):
+        """Probes every reader with SELECT 1, bringing recovered ones back into rotation."""
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                replica.healthy = True
+            except Exception:
+                if replica.healthy:
+                    replica.failures += 1
+                replica.healthy = False
+            replica.checked = time.time()
+
+    def _loop(self):
+        while not self._stop.wait(HEALTH_SECONDS):
+            self.check()
+
+    def start(self):
+        if self.replicas:
+            self._thread = threading.Thread(target=self._loop, name="db-health", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def metrics(self):
+        return {
+            "writer": {"url": self.writer.url.render_as_string(hide_password=True), "reads": self._writer_reads},
+            "readers": [
+                {"url": replica.engine.url.render_as_string(hide_password=True), "healthy": replica.healthy,
+                 "failures": replica.failures, "reads": replica.reads, "checked": replica.checked}
+                for replica in self.replicas
+            ],
+            "sticky_sessions": len(self._writes),
+        }
+
+
+def from_env(default_url: str):
+    """Router built from DB_WRITER_URL / DB_READER_URLS, falling back to default_url for the writer."""
+    writer = create_engine(os.getenv("DB_WRITER_URL") or default_url)
+    urls = [url.strip() for url in os.getenv("DB_READER_URLS", "").split(",") if url.strip()]
+    readers = [create_engine(url, pool_pre_ping=True) for url in urls]
+    return Router(writer, readers)
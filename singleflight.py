@@ -0,0 +1,99 @@
+from sqlalchemy import Engine
+import copy
+import inspect
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+def _freeze(value):
+    """Hashable form of a call argument, engines are keyed by identity."""
+    if isinstance(value, Engine):
+        return ("engine", id(value))
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller runs the function and every
+    caller that arrives while it is in flight waits for and shares that result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {}
+
+    def key(self, fn, args, kwargs):
+        """Function plus its arguments bound to parameter names with defaults applied, so
+        f(engine, 10) and f(engine, years=10) are the same call."""
+        try:
+            bound = inspect.signature(fn).bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = tuple((name, _freeze(value)) for name, value in bound.arguments.items())
+        except TypeError:
+            params = (_freeze(args), _freeze(kwargs))
+        return (fn.__module__, fn.__qualname__, params)
+
+    def do(self, fn, *args, **kwargs):
+        key = self.key(fn, args, kwargs)
+        with self._lock:
+            stats = self._stats.setdefault(fn.__qualname__, {"executions": 0, "coalesced": 0})
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                stats["executions"] += 1
+            else:
+                call.waiters += 1
+                stats["coalesced"] += 1
+
+        if leader:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+
+        # results are dataframes/dicts the endpoints go on to modify, so sharers each get their own copy
+        if call.waiters:
+            return copy.deepcopy(call.result)
+        return call.result
+
+    def metrics(self):
+        with self._lock:
+            per_function = {name: dict(stats) for name, stats in self._stats.items()}
+            in_flight = len(self._calls)
+        return {
+            "executions": sum(s["executions"] for s in per_function.values()),
+            "coalesced": sum(s["coalesced"] for s in per_function.values()),
+            "in_flight": in_flight,
+            "functions": per_function,
+        }
+
+
+flights = SingleFlight()
+
+
+def call(fn, *args, **kwargs):
+    """Runs a read query through the shared single-flight group."""
+    return flights.do(fn, *args, **kwargs)
@@ -0,0 +1,315 @@
+from sqlalchemy import Engine
+import numpy as np
+import pandas as pd
+
+import rollup
+import snapshot
+
+# 95% intervals for the error bounds returned with approximate answers
+Z95 = 1.96
+
+
+def hash64(values):
+    """Stable 64-bit hashes of any column of values."""
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+# coin flips for KLL compactions, shared so a sketch is only its levels
+_coins = np.random.default_rng(0)
+
+
+class HyperLogLog:
+    """
+    Distinct counter, mergeable by register max. Stays exact (a sorted set of hashes) until it
+    holds more hashes than its dense registers would cost, so small groups have no error at all
+    and dense registers never take more than 8 bytes per hash they replaced.
+    """
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.m = 1 << p
+        self.hashes = np.empty(0, dtype="uint64")
+        self.registers = None
+
+    def add(self, hashes: np.ndarray):
+        hashes = np.asarray(hashes, dtype="uint64")
+        if self.registers is None:
+            self.hashes = np.union1d(self.hashes, hashes)
+            if len(self.hashes) > self.m // 8:
+                self._densify()
+        else:
+            self._add_dense(hashes)
+        return self
+
+    def _densify(self):
+        self.registers = np.zeros(self.m, dtype="uint8")
+        self._add_dense(self.hashes)
+        self.hashes = np.empty(0, dtype="uint64")
+
+    def _add_dense(self, hashes: np.ndarray):
+        index = (hashes >> np.uint64(64 - self.p)).astype("int64")
+        rest = hashes << np.uint64(self.p)
+        # position of the first 1 bit in the remaining 64 - p bits
+        bits = np.floor(np.log2(np.maximum(rest, 1).astype("float64"))).astype("int64")
+        bits -= (rest >> np.minimum(bits, 63).astype("uint64")) == 0
+        rho = np.where(rest == 0, 64 - self.p + 1, np.minimum(63 - bits + 1, 64 - self.p + 1)).astype("uint8")
+        np.maximum.at(self.registers, index, rho)
+
+    def merge(self, *others: "HyperLogLog"):
+        sketches = (self,) + others
+        merged = HyperLogLog(self.p)
+        if all(sketch.registers is None for sketch in sketches):
+            return merged.add(np.concatenate([sketch.hashes for sketch in sketches]))
+        merged.registers = np.zeros(self.m, dtype="uint8")
+        for sketch in sketches:
+            if sketch.registers is None:
+                merged._add_dense(sketch.hashes)
+            else:
+                np.maximum(merged.registers, sketch.registers, out=merged.registers)
+        return merged
+
+    def estimate(self):
+        if self.registers is None:
+            return float(len(self.hashes))
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m ** 2 / np.sum(np.exp2(-self.registers.astype("float64")))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * self.m and zeros:
+            return self.m * np.log(self.m / zeros)
+        return float(raw)
+
+    def relative_error(self):
+        """95% relative error bound of estimate(), 0 while still exact."""
+        return 0.0 if self.registers is None else Z95 * 1.04 / np.sqrt(self.m)
+
+
+class KLL:
+    """Quantile sketch: levels of sorted compactors, each item at level h standing for 2**h values."""
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+
+    def _capacity(self, level: int):
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                odd = len(items) % 2
+                # every other item survives one level up, from a random start so the error is unbiased
+                promoted = items[odd:][int(_coins.integers(2))::2]
+                self.levels[level] = items[:odd]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                level = 0
+                continue
+            level += 1
+
+    def merge(self, *others: "KLL"):
+        sketches = (self,) + others
+        merged = KLL(self.k)
+        merged.n = sum(sketch.n for sketch in sketches)
+        depth = max(len(sketch.levels) for sketch in sketches)
+        merged.levels = [
+            np.concatenate([sketch.levels[h] for sketch in sketches if h < len(sketch.levels)])
+            for h in range(depth)
+        ]
+        merged._compress()
+        return merged
+
+    def quantile(self, q: float):
+        if self.n == 0:
+            return None
+        if len(self.levels) == 1:
+            # still exact, interpolated like np.median so an error of 0 means the exact answer
+            return float(np.quantile(self.levels[0], q))
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items_h), 2 ** h) for h, items_h in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        position = min(np.searchsorted(cumulative, q * cumulative[-1]), len(items) - 1)
+        return float(items[order][position])
+
+    def rank_error(self):
+        """Normalized rank error of quantile() (DataSketches' empirical bound for KLL), 0 while exact."""
+        return 0.0 if len(self.levels) == 1 else 2.296 / self.k ** 0.9723
+
+
+def _pin_hashes(frame: pd.DataFrame):
+    return hash64(frame["pin"].fillna(""))
+
+
+def group_sketches(engine: Engine, dims):
+    """
+    Per cell of the dims cuboid: a HyperLogLog of pins, a KLL of totactval and the exact row count,
+    totactval count and sum (which merge exactly). Built once per snapshot and only for the cuboids
+    asked for, so the cells stay as coarse as the queries using them.
+    """
+    dims = tuple(d for d in rollup.DIMENSIONS if d in dims)
+
+    def build(frame):
+        hashes = snapshot.derived(engine, "sketches:pins", _pin_hashes)
+        values = frame["totactval"].to_numpy()
+        if dims:
+            groups = rollup.dimension_frame(frame).groupby(list(dims), dropna=False, sort=False).indices
+        else:
+            groups = {(): np.arange(len(frame))}
+        cells = {}
+        for key, rows in groups.items():
+            key = key if isinstance(key, tuple) else (key,)
+            cell_values = values[rows]
+            cells[key] = {
+                "pins": HyperLogLog().add(hashes[rows]),
+                "quantiles": KLL().update(cell_values),
+                "rows": len(rows),
+                "count": int(np.count_nonzero(~np.isnan(cell_values))),
+                "total": float(np.nansum(cell_values)),
+            }
+        return cells
+
+    return snapshot.derived(engine, f"sketches:{','.join(dims)}", build)
+
+
+def _merge_cells(cells):
+    if len(cells) == 1:
+        return cells[0]
+    return {
+        "pins": cells[0]["pins"].merge(*(cell["pins"] for cell in cells[1:])),
+        "quantiles": cells[0]["quantiles"].merge(*(cell["quantiles"] for cell in cells[1:])),
+        "rows": sum(cell["rows"] for cell in cells),
+        "count": sum(cell["count"] for cell in cells),
+        "total": sum(cell["total"] for cell in cells),
+    }
+
+
+def _matches(value, wanted: str):
+    return value is not None and not (isinstance(value, float) and np.isnan(value)) \
+        and snapshot.normalize_key(str(value)) == snapshot.normalize_key(wanted)
+
+
+def approx_aggregate(engine: Engine, group_by, filters: dict or None = None):
+    """
+    Distinct parcels and median totactval per group from merged sketches, each with its 95% error
+    bound, plus the average from the exact per-cell sums (so its error is 0). Cells of the
+    (group_by + filter dimensions) cuboid that pass the filters are merged into their group.
+    """
+    filters = filters or {}
+    unknown = [d for d in list(group_by) + list(filters) if d not in rollup.DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension(s): {', '.join(unknown)}")
+    dims = tuple(d for d in rollup.DIMENSIONS if d in set(group_by) | set(filters))
+    cells = group_sketches(engine, dims)
+
+    grouped = {}
+    for key, cell in cells.items():
+        values = dict(zip(dims, key))
+        if all(_matches(values[d], v) for d, v in filters.items()):
+            grouped.setdefault(tuple(values[d] for d in group_by), []).append(cell)
+
+    rows = []
+    for key, group in grouped.items():
+        cell = _merge_cells(group)
+        distinct = cell["pins"].estimate()
+        rows.append({
+            **dict(zip(group_by, key)),
+            "rows": cell["rows"],
+            "distinct_parcels": round(distinct),
+            "distinct_parcels_error": round(distinct * cell["pins"].relative_error()),
+            "totactval_avg": cell["total"] / cell["count"] if cell["count"] else None,
+            "totactval_avg_error": 0.0,
+            "totactval_median": cell["quantiles"].quantile(0.5),
+            "totactval_median_rank_error": cell["quantiles"].rank_error(),
+        })
+    df = pd.DataFrame(rows, columns=list(group_by) + [
+        "rows", "distinct_parcels", "distinct_parcels_error", "totactval_avg", "totactval_avg_error",
+        "totactval_median", "totactval_median_rank_error"])
+    return df
+
+
+TURNOVER_GROUPS = {"neighborhood": ("nhdnam", False), "subdivision": ("subnam", True)}
+SAMPLE_PINS = 2048
+
+
+def _turnover_sketches(group: str):
+    column, residential = TURNOVER_GROUPS[group]
+
+    def build(frame: pd.DataFrame):
+        if residential:
+            frame = frame[frame["taxcls"].str.startswith("1").fillna(False)]
+        pins = frame.groupby([column, "pin"], dropna=False, sort=False)["last_sale"].max().reset_index()
+        pins["hash"] = hash64(pins["pin"].fillna(""))
+        codes, names = pd.factorize(pins[column], use_na_sentinel=False)
+        pins["code"] = codes
+
+        # pins are already grouped exactly, so the distinct count per group is just a bincount
+        totals = np.bincount(codes, minlength=len(names)).astype("float64")
+
+        # bottom-k pins per group by hash: a uniform sample of the group's distinct pins
+        pins = pins.sort_values(["code", "hash"], kind="mergesort")
+        sample = pins[pins.groupby("code").cumcount() < SAMPLE_PINS]
+        return {
+            "names": names,
+            "totals": totals,
+            "sample_codes": sample["code"].to_numpy(),
+            "sample_sales": sample["last_sale"].to_numpy(),
+            "sample_sizes": np.bincount(sample["code"].to_numpy(), minlength=len(names)),
+        }
+
+    return build
+
+
+def approx_turnover(engine: Engine, group: str, years: int = 10, limit: int or None = None,
+                    after: tuple or None = None):
+    """
+    turnover_neighborhood / turnover_subdivision from sketches: exact distinct pins per group, the share
+    sold in the window from a bottom-k sample of the group's pins. The sold count and the percent come
+    with a 95% error bound (0 where the group was small enough to be sampled whole).
+    """
+    s = snapshot.derived(engine, f"sketches:turnover:{group}", _turnover_sketches(group))
+    cutoff = np.datetime64(pd.Timestamp.today().normalize() - pd.DateOffset(years=years))
+    sold = np.bincount(s["sample_codes"][s["sample_sales"] >= cutoff], minlength=len(s["names"]))
+    size = np.maximum(s["sample_sizes"], 1)
+    fraction = sold / size
+    with np.errstate(invalid="ignore"):
+        correction = np.sqrt(np.clip(1 - s["sample_sizes"] / np.maximum(s["totals"], 1), 0, 1))
+    fraction_error = Z95 * np.sqrt(fraction * (1 - fraction) / size) * correction
+    total = s["totals"]
+    estimate = fraction * total
+
+    result = pd.DataFrame({
+        group: s["names"],
+        "properties_sold_last_period": np.round(estimate).astype("int64"),
+        "properties_sold_error": np.round(fraction_error * total).astype("int64"),
+        "total_properties": np.round(total).astype("int64"),
+        "total_properties_error": np.zeros(len(total), dtype="int64"),
+        "turnover_percent": np.round(fraction * 100, 2),
+        "turnover_percent_error": np.round(fraction_error * 100, 2),
+    })
+    if TURNOVER_GROUPS[group][1]:
+        result = result[result["total_properties"] >= 20]
+    result[group] = result[group].astype(object).where(result[group].notna(), None)
+    result["name_key"] = result[group].fillna("")
+    result = result.sort_values(["turnover_percent", "name_key"], ascending=[False, True], kind="mergesort")
+    if after:
+        pct, name = float(after[0]) if after[0] is not None else -1.0, after[1] or ""
+        pcts = result["turnover_percent"]
+        result = result[(pcts < pct) | ((pcts == pct) & (result["name_key"] > name))]
+    result = result.drop(columns="name_key")
+    if limit is not None:
+        result = result.head(limit)
+    return result.reset_index(drop=True)
@@ -0,0 +1,214 @@
+from contextvars import ContextVar
+from sqlalchemy import Engine
+import hashlib
+import pandas as pd
+import threading
+import time
+
+import query
+
+# columns pulled into memory for the precomputed endpoints, add to these as new structures need them
+COLUMNS = [
+    "objectid", "pin",
+    "prpaddress", "prpctynam", "prpzip5", "prpstrnam", "prpstrtyp",
+    "nhdnam", "subnam", "taxcls", "ownico", "pindesc",
+    "valact", "totactval", "pyrtotval",
+    "x_coord", "y_coord",
+    "prpstrnum", "mailstrnbr", "mailstrnam", "mailctynam", "mailzip5",
+    "ownnam", "ownnam2", "ownnam3",
+    "slsdt", "slsdt2", "slsdt3", "slsdt4",
+]
+NUMERIC_COLUMNS = ["valact", "totactval", "pyrtotval", "x_coord", "y_coord"]
+SALE_DATE_COLUMNS = ["slsdt", "slsdt2", "slsdt3", "slsdt4"]
+
+_lock = threading.Lock()
+_build_locks = {}
+_frame = None
+_derived = {}
+_version = 1
+_modified = time.time()
+_fingerprint = None
+# engine the next load must come from, set by mark_stale() after a write so a lagging replica is not cached
+_reload_from = None
+
+# a snapshot being built by refresh() before it is swapped in, seen only by the thread building it
+_staged = ContextVar("staged_snapshot", default=None)
+
+
+def full_table(engine: Engine):
+    """Quoted table name the same way the comps queries build it (sqlite stand-ins have no schema)."""
+    if query.schema and engine.dialect.name != "sqlite":
+        return f'"{query.schema}"."{query.parcels}"'
+    return f'"{query.parcels}"'
+
+
+def normalize(values: pd.Series):
+    """Python side of UPPER(TRIM(col)) so group keys match the SQL filters."""
+    return values.astype("string").str.strip().str.upper()
+
+
+def normalize_key(value: str or None):
+    return value.strip().upper() if value is not None else None
+
+
+def _normalized_address(*parts: pd.Series):
+    """UPPER(TRIM(COALESCE(a, '') || ' ' || ...)) with whitespace collapsed, as occupancy_counts_city builds it."""
+    text = parts[0].fillna("").astype(str)
+    for part in parts[1:]:
+        text = text + " " + part.fillna("").astype(str)
+    return text.str.strip().str.replace(r"\s+", " ", regex=True).str.upper()
+
+
+def _add_derived_columns(frame: pd.DataFrame):
+    """
+    last_sale: latest of the four MMDDYYYY sale dates (turnover only needs to know if any falls in the window)
+    occupancy: commercial / owner_occupied / rental by the same rules as occupancy_counts_city
+    """
+    sales = [pd.to_datetime(frame[col], format="%m%d%Y", errors="coerce") for col in SALE_DATE_COLUMNS]
+    frame["last_sale"] = pd.concat(sales, axis=1).max(axis=1)
+
+    prop = _normalized_address(frame["prpstrnum"], frame["prpstrnam"], frame["prpctynam"])
+    mail = _normalized_address(frame["mailstrnbr"], frame["mailstrnam"], frame["mailctynam"])
+    occupancy = pd.Series("rental", index=frame.index)
+    occupancy[(mail == "") | (mail == prop)] = "owner_occupied"
+    occupancy[frame["ownico"].notna()] = "commercial"
+    frame["occupancy"] = occupancy
+    return frame.drop(columns=SALE_DATE_COLUMNS)
+
+
+def _load(engine: Engine):
+    query_text = f"SELECT {', '.join(COLUMNS)} FROM {full_table(engine)}"
+    frame = pd.read_sql_query(query_text, engine)
+    for col in NUMERIC_COLUMNS:
+        frame[col] = pd.to_numeric(frame[col], errors="coerce").astype("float64")
+    return _add_derived_columns(frame)
+
+
+def _digest(frame: pd.DataFrame):
+    """
+    Content hash of a snapshot, the same in every worker process that loaded the same data. Rows are
+    summed rather than concatenated, since the load has no ORDER BY and scans may return them in any order.
+    """
+    rows = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    return hashlib.sha1(rows.sum(dtype="uint64").tobytes() + len(rows).to_bytes(8, "little")).hexdigest()[:16]
+
+
+def get_frame(engine: Engine):
+    """Returns the parcel snapshot, loading it on first use."""
+    global _frame, _fingerprint, _reload_from
+    staged = _staged.get()
+    if staged is not None:
+        return staged["frame"]
+    frame = _frame
+    if frame is None:
+        with _lock:
+            if _frame is None:
+                loaded = _load(_reload_from or engine)
+                _fingerprint = _digest(loaded)
+                _frame = loaded
+                _reload_from = None
+            frame = _frame
+    return frame
+
+
+def derived(engine: Engine, name: str, builder, stamp=None):
+    """
+    Returns builder(frame) for the current snapshot, building it once per snapshot. Answers that also
+    depend on something else (the current date) pass it as stamp and are rebuilt when it changes.
+    """
+    staged = _staged.get()
+    if staged is not None:
+        cached = staged["derived"].get(name)
+        if cached is None or cached[3] != stamp:
+            cached = staged["derived"][name] = (staged["frame"], builder(staged["frame"]), builder, stamp)
+        return cached[1]
+    frame = get_frame(engine)
+    cached = _derived.get(name)
+    if cached is not None and cached[0] is frame and cached[3] == stamp:
+        return cached[1]
+    with _lock:
+        build_lock = _build_locks.setdefault(name, threading.Lock())
+    with build_lock:
+        cached = _derived.get(name)
+        if cached is not None and cached[0] is frame and cached[3] == stamp:
+            return cached[1]
+        value = builder(frame)
+        _derived[name] = (frame, value, builder, stamp)
+        return value
+
+
+def mark_stale(reload_from: Engine or None = None):
+    """
+    Records a write: a new data version (so precomputed answers and validators handed out so far stop
+    matching) while requests keep the current frame and its derived structures until refresh() swaps
+    in the reloaded one, from reload_from when given (the writer, a replica may not have the write yet).
+    """
+    global _version, _modified, _fingerprint, _reload_from
+    with _lock:
+        _reload_from = reload_from or _reload_from
+        _fingerprint = None
+        _version += 1
+        _modified = time.time()
+
+
+def refresh(engine: Engine, rebuild=None):
+    """
+    Reloads the snapshot without blocking readers. The new frame is loaded outside the lock, then
+    rebuild() (the warm-up tasks) and every structure built from the old frame are rebuilt against it
+    before it is swapped in, so requests never find the new snapshot cold. Unchanged data keeps the old
+    frame (and its derived structures and version); so does a write that marked it stale meanwhile.
+    """
+    global _frame, _version, _modified, _fingerprint, _reload_from
+    version = _version
+    frame = _load(_reload_from or engine)
+    if _frame is not None and _frame.equals(frame):
+        if _fingerprint is None:
+            # a write that left the data as it was, the old frame's hash holds again
+            fingerprint = _digest(frame)
+            with _lock:
+                if _version == version:
+                    _fingerprint = fingerprint
+                    _reload_from = None
+        return False
+
+    staged = {"frame": frame, "derived": {}, "version": version + 1}
+    token = _staged.set(staged)
+    try:
+        if rebuild is not None:
+            rebuild()
+        for name, (_, _, builder, stamp) in list(_derived.items()):
+            # stamped ones may be out of date already, they rebuild on their next use
+            if stamp is None:
+                derived(engine, name, builder)
+    finally:
+        _staged.reset(token)
+
+    fingerprint = _digest(frame)
+    with _lock:
+        if _version != version:
+            return False
+        _frame = frame
+        _fingerprint = fingerprint
+        _reload_from = None
+        _derived.clear()
+        _derived.update(staged["derived"])
+        _version += 1
+        _modified = time.time()
+    return True
+
+
+def data_version():
+    staged = _staged.get()
+    return staged["version"] if staged is not None else _version
+
+
+def fingerprint():
+    """
+    Content hash of the loaded snapshot (agrees across workers), None while there is none: a local
+    counter would repeat in every worker and after every restart.
+    """
+    return _fingerprint
+
+
+def last_modified():
+    return _modified
@@ -0,0 +1,255 @@
+from sqlalchemy import Engine
+import numpy as np
+import pandas as pd
+
+import snapshot
+import utilities
+
+CELL_FEET = 1000.0
+# /parcels/nearest answers points up to this far outside the parcels' extent (5 miles)
+SEARCH_MARGIN_FEET = 26_400.0
+
+
+class GridIndex:
+    """Uniform grid over x/y (feet): point ids sorted by cell with the [start, end) range of every occupied cell."""
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, cell: float = CELL_FEET):
+        self.x = np.asarray(x, dtype="float64")
+        self.y = np.asarray(y, dtype="float64")
+        self.cell = cell
+        self.x0 = float(self.x.min()) if len(self.x) else 0.0
+        self.y0 = float(self.y.min()) if len(self.y) else 0.0
+        ix, iy = self._cell(self.x, self.y)
+        self.nx = int(ix.max()) + 1 if len(ix) else 1
+        self.ny = int(iy.max()) + 1 if len(iy) else 1
+
+        ids = ix * self.ny + iy
+        self.order = np.argsort(ids, kind="stable")
+        sorted_ids = ids[self.order]
+        cells, starts = np.unique(sorted_ids, return_index=True)
+        ends = np.append(starts[1:], len(sorted_ids))
+        self.cells = dict(zip(cells.tolist(), zip(starts.tolist(), ends.tolist())))
+
+    def _cell(self, x, y):
+        ix = np.floor((np.asarray(x) - self.x0) / self.cell).astype("int64")
+        iy = np.floor((np.asarray(y) - self.y0) / self.cell).astype("int64")
+        return ix, iy
+
+    def _points_in(self, ix_range, iy_range):
+        parts = []
+        for i in ix_range:
+            if i < 0 or i >= self.nx:
+                continue
+            for j in iy_range:
+                if 0 <= j < self.ny:
+                    span = self.cells.get(i * self.ny + j)
+                    if span is not None:
+                        parts.append(self.order[span[0]:span[1]])
+        return np.concatenate(parts) if parts else np.empty(0, dtype="int64")
+
+    def bbox(self, xmin: float, ymin: float, xmax: float, ymax: float):
+        """Ids of the points in every cell the box touches (a superset of the points inside it)."""
+        (ix0, ix1), (iy0, iy1) = self._cell([xmin, xmax], [ymin, ymax])
+        return self._points_in(range(max(ix0, 0), min(ix1, self.nx - 1) + 1),
+                               range(max(iy0, 0), min(iy1, self.ny - 1) + 1))
+
+    def contains(self, x: float, y: float, margin: float = 0.0):
+        """Whether (x, y) lies within margin feet of the grid's extent."""
+        return (self.x0 - margin <= x <= self.x0 + self.nx * self.cell + margin and
+                self.y0 - margin <= y <= self.y0 + self.ny * self.cell + margin)
+
+    def nearest(self, x: float, y: float, k: int):
+        """(ids, distances) of the k closest points, searching outward one ring of cells at a time."""
+        cx, cy = (int(v) for v in self._cell(x, y))
+        ids = np.empty(0, dtype="int64")
+        # rings before the first one reaching the grid are empty, rings past the farthest cell find nothing new
+        first_ring = max(0, -cx, cx - (self.nx - 1), -cy, cy - (self.ny - 1))
+        max_ring = max(abs(cx), abs(cy), abs(self.nx - 1 - cx), abs(self.ny - 1 - cy))
+        for ring in range(first_ring, max_ring + 1):
+            if ring == 0:
+                found = self._points_in([cx], [cy])
+            else:
+                # only the part of the ring's edges that overlaps the grid
+                edge = range(max(cx - ring, 0), min(cx + ring, self.nx - 1) + 1)
+                side = range(max(cy - ring + 1, 0), min(cy + ring - 1, self.ny - 1) + 1)
+                found = [self._points_in(edge, [cy - ring, cy + ring]),
+                         self._points_in([cx - ring, cx + ring], side)]
+                found = np.concatenate(found)
+            ids = np.concatenate([ids, found])
+            # anything beyond this ring is at least ring * cell away
+            if len(ids) >= k:
+                dist = np.hypot(self.x[ids] - x, self.y[ids] - y)
+                if np.partition(dist, k - 1)[k - 1] <= ring * self.cell:
+                    break
+        dist = np.hypot(self.x[ids] - x, self.y[ids] - y)
+        top = np.argsort(dist, kind="stable")[:k]
+        return ids[top], dist[top]
+
+
+def _build_pins(frame: pd.DataFrame):
+    """One row per pin: centroid of its records plus the lowest objectid record's address."""
+    df = frame[frame["x_coord"].notna() & frame["y_coord"].notna() & frame["pin"].notna()]
+    df = df.sort_values("objectid", kind="mergesort")
+    pins = df.groupby("pin", sort=False).agg(
+        objectid=("objectid", "first"),
+        address=("prpaddress", "first"),
+        city=("prpctynam", "first"),
+        zip=("prpzip5", "first"),
+        x_coord=("x_coord", "mean"),
+        y_coord=("y_coord", "mean"),
+    ).reset_index()
+    return pins
+
+
+def pin_frame(engine: Engine):
+    return snapshot.derived(engine, "spatial:pins", _build_pins)
+
+
+def pin_index(engine: Engine):
+    def build(frame):
+        pins = pin_frame(engine)
+        return GridIndex(pins["x_coord"].to_numpy(), pins["y_coord"].to_numpy())
+    return snapshot.derived(engine, "spatial:pin_index", build)
+
+
+def nearest_parcels(engine: Engine, lat: float, lon: float, k: int = 5):
+    """k nearest parcels (by pin centroid) to a WGS84 point, ValueError for points far outside the parcels."""
+    x, y = utilities.lat_long_to_coords(lat, lon)
+    pins = pin_frame(engine)
+    index = pin_index(engine)
+    if not index.contains(x, y, SEARCH_MARGIN_FEET):
+        raise ValueError("Please provide a latitude and longitude within Jefferson County.")
+    ids, dist = index.nearest(x, y, k)
+
+    rows = pins.iloc[ids]
+    lons, lats = utilities.transformer(utilities.PARCEL_CRS, utilities.WGS84).transform(
+        rows["x_coord"].to_numpy(), rows["y_coord"].to_numpy())
+    result = rows[["pin", "objectid", "address", "city", "zip"]].copy()
+    result["distance_feet"] = dist
+    result["lat"] = lats
+    result["lon"] = lons
+    return result.astype(object).where(result.notna(), None).to_dict(orient="records")
+
+
+def record_index(engine: Engine):
+    """Grid over every parcel record with coordinates, returns (snapshot row positions, index)."""
+    def build(frame):
+        positions = np.flatnonzero((frame["x_coord"].notna() & frame["y_coord"].notna()).to_numpy())
+        return positions, GridIndex(frame["x_coord"].to_numpy()[positions], frame["y_coord"].to_numpy()[positions])
+    return snapshot.derived(engine, "spatial:record_index", build)
+
+
+def parse_polygons(geojson: dict):
+    """
+    Polygons (each a list of rings, projected to parcel feet) from a GeoJSON Polygon or
+    MultiPolygon geometry, or a Feature wrapping one. Raises ValueError otherwise.
+    """
+    if geojson.get("type") == "Feature":
+        geojson = geojson.get("geometry") or {}
+    kind = geojson.get("type")
+    coordinates = geojson.get("coordinates")
+    if kind == "Polygon":
+        polygons = [coordinates]
+    elif kind == "MultiPolygon":
+        polygons = coordinates
+    else:
+        raise ValueError("Please provide a GeoJSON Polygon or MultiPolygon.")
+
+    projected = []
+    try:
+        for polygon in polygons:
+            rings = []
+            for ring in polygon:
+                lonlat = np.asarray(ring, dtype="float64")[:, :2]
+                if len(lonlat) < 3:
+                    raise ValueError("Polygon rings need at least 3 positions.")
+                x, y = utilities.lat_long_to_coords(lonlat[:, 1], lonlat[:, 0])
+                rings.append(np.column_stack([x, y]))
+            if rings:
+                projected.append(rings)
+    except (TypeError, IndexError):
+        raise ValueError("Polygon coordinates must be lists of [lon, lat] positions.")
+    if not projected:
+        raise ValueError("Polygon has no coordinates.")
+    return projected
+
+
+def points_in_polygon(px: np.ndarray, py: np.ndarray, rings):
+    """Even-odd ray casting over every edge of every ring, so holes fall out naturally."""
+    inside = np.zeros(len(px), dtype=bool)
+    for ring in rings:
+        xi, yi = ring[:, 0], ring[:, 1]
+        xj, yj = np.roll(xi, 1), np.roll(yi, 1)
+        for x1, y1, x2, y2 in zip(xi, yi, xj, yj):
+            if y1 == y2:
+                continue
+            crosses = (y1 > py) != (y2 > py)
+            inside ^= crosses & (px < (x2 - x1) * (py - y1) / (y2 - y1) + x1)
+    return inside
+
+
+def region_parcels(engine: Engine, geojson: dict):
+    """Snapshot rows inside a GeoJSON polygon: grid bounding-box candidates, then a vectorized point-in-polygon test."""
+    polygons = parse_polygons(geojson)
+    frame = snapshot.get_frame(engine)
+    positions, index = record_index(engine)
+
+    matched = []
+    for rings in polygons:
+        outer = rings[0]
+        candidates = index.bbox(outer[:, 0].min(), outer[:, 1].min(), outer[:, 0].max(), outer[:, 1].max())
+        inside = points_in_polygon(index.x[candidates], index.y[candidates], rings)
+        matched.append(candidates[inside])
+    ids = np.unique(np.concatenate(matched))
+    return frame.iloc[positions[ids]]
+
+
+def region_stats(parcels: pd.DataFrame, years: int = 10):
+    """Counts, value totals, turnover over the last `years` and occupancy mix for a set of parcel records."""
+    pins = parcels["pin"].dropna()
+    total_pins = int(pins.nunique())
+    cutoff = pd.Timestamp.today().normalize() - pd.DateOffset(years=years)
+    sold_pins = int(parcels.loc[parcels["last_sale"] >= cutoff, "pin"].dropna().nunique())
+
+    paired = parcels["totactval"].notna() & parcels["pyrtotval"].notna()
+    current = float(parcels.loc[paired, "totactval"].sum())
+    prior = float(parcels.loc[paired, "pyrtotval"].sum())
+    occupancy = parcels["occupancy"].value_counts()
+
+    def optional(value):
+        return float(value) if pd.notna(value) else None
+
+    return {
+        "num_records": int(len(parcels)),
+        "num_parcels": total_pins,
+        "total_market_value": float(parcels["totactval"].sum()),
+        "total_prior_value": float(parcels["pyrtotval"].sum()),
+        "avg_price": optional(parcels["valact"].mean()),
+        "min_price": optional(parcels["valact"].min()),
+        "max_price": optional(parcels["valact"].max()),
+        "value_change": current - prior,
+        "value_change_pct": round((current - prior) / prior * 100, 2) if prior > 0 else None,
+        "turnover": {
+            "years": years,
+            "properties_sold_last_period": sold_pins,
+            "turnover_percent": round(sold_pins / total_pins * 100, 2) if total_pins else None,
+        },
+        "occupancy_counts": [
+            {"occupancy_type": kind, "count": int(occupancy.get(kind, 0))}
+            for kind in ("commercial", "owner_occupied", "rental")
+        ],
+    }
+
+
+REGION_PARCEL_COLUMNS = {
+    "objectid": "objectid", "pin": "pin", "prpaddress": "property_address", "prpctynam": "property_city",
+    "prpzip5": "property_zip", "totactval": "primary_market_value", "valact": "price",
+    "occupancy": "occupancy_type", "x_coord": "x_coord", "y_coord": "y_coord",
+}
+
+
+def stream_region_parcels(parcels: pd.DataFrame, chunk_rows: int = 5000):
+    """Newline delimited JSON of the matched parcels, serialized a chunk at a time."""
+    df = parcels[list(REGION_PARCEL_COLUMNS)].rename(columns=REGION_PARCEL_COLUMNS)
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_json(orient="records", lines=True).rstrip("\n") + "\n"
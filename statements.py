@@ -0,0 +1,160 @@
+from sqlalchemy import Engine, text
+import hashlib
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+
+
+def _prepare():
+    """
+    Server side PREPARE/EXECUTE on Postgres, DB_PREPARE=0 turns it off behind poolers that do not keep
+    sessions (pgbouncer transaction mode). Read on use, ingest loads .env after importing this module.
+    """
+    return os.getenv("DB_PREPARE", "1") not in ("0", "false", "no")
+
+
+# :name binds, the same rule text() uses (so ::casts are left alone)
+_BIND = re.compile(r"(?<![:\w\x5c]):(\w+)(?!:)")
+
+_lock = threading.Lock()
+REGISTRY = {}
+_stats = {}
+
+
+def _tables():
+    """Table names statements are formatted with, read from query so changing them there rebuilds every statement."""
+    # query defines its statements at import time, so it can only be imported here
+    import query
+
+    full_table = f'"{query.schema}"."{query.parcels}"' if query.schema else f'"{query.parcels}"'
+    return {"schema": query.schema, "parcels": query.parcels, "parcel_pins": query.parcel_pins,
+            "stars": query.stars, "full_table": full_table}
+
+
+class Statement:
+    """
+    One named statement: the SQL template, built once (per set of table names) into a text()
+    object for any database and a $n form with a stable name for PREPARE on Postgres.
+    """
+
+    def __init__(self, name: str, template: str, parts: dict):
+        self.name = name
+        self.template = template
+        self.parts = parts
+        self._built = None
+
+    def build(self):
+        tables = _tables()
+        key = tuple(sorted(tables.items()))
+        built = self._built
+        if built is None or built["key"] != key:
+            parts = {k: v.format(**tables) for k, v in self.parts.items()}
+            sql = self.template.format(**tables, **parts)
+            binds = list(dict.fromkeys(_BIND.findall(sql)))
+            digest = hashlib.sha1(sql.encode()).hexdigest()[:10]
+            built = {
+                "key": key,
+                "text": text(sql),
+                "binds": binds,
+                "prepare_sql": _BIND.sub(lambda m: f"${binds.index(m.group(1)) + 1}", sql),
+                "prepared_name": f"{re.sub(r'[^a-z0-9_]', '_', self.name.lower())}_{digest}",
+            }
+            self._built = built
+        return built
+
+
+def define(name: str, template: str, **parts):
+    """
+    Registers a statement. template uses :name binds and {schema}, {parcels}, {parcel_pins},
+    {stars} and {full_table} for table names; parts are further template pieces filled the same way.
+    """
+    REGISTRY[name] = Statement(name, template, parts)
+    _stats[name] = {"calls": 0, "errors": 0, "rows": 0, "seconds": 0.0, "prepares": 0}
+    return name
+
+
+def _record(name: str, seconds: float, rows: int = 0, error: bool = False, prepared: bool = False):
+    with _lock:
+        stats = _stats[name]
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["rows"] += rows
+        stats["errors"] += error
+        stats["prepares"] += prepared
+
+
+def _execute(conn, statement: Statement, params: dict):
+    """Runs the statement on conn, returning (result, whether it was prepared on this connection first)."""
+    built = statement.build()
+    params = {name: params[name] for name in built["binds"]}
+    if not _prepare() or conn.dialect.name != "postgresql":
+        return conn.execute(built["text"], params), False
+
+    # prepared statements live as long as the DBAPI connection, so remember them on it (pool info survives checkouts)
+    prepared = conn.connection.info.setdefault("prepared_statements", set())
+    name = built["prepared_name"]
+    first = name not in prepared
+    if first:
+        conn.execution_options(no_parameters=True).exec_driver_sql(f"PREPARE {name} AS {built['prepare_sql']}")
+        prepared.add(name)
+    if not built["binds"]:
+        return conn.execution_options(no_parameters=True).exec_driver_sql(f"EXECUTE {name}"), first
+    args = ", ".join(f"%({bind})s" for bind in built["binds"])
+    return conn.exec_driver_sql(f"EXECUTE {name}({args})", params), first
+
+
+def read(engine: Engine, name: str, params: dict or None = None):
+    """Runs a registered SELECT and returns its rows as a DataFrame (numerics coerced like pd.read_sql)."""
+    statement = REGISTRY[name]
+    start = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            result, prepared = _execute(conn, statement, params or {})
+            df = pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()), coerce_float=True)
+    except Exception:
+        _record(name, time.perf_counter() - start, error=True)
+        raise
+    _record(name, time.perf_counter() - start, len(df), prepared=prepared)
+    return df
+
+
+def execute(engine: Engine, name: str, params: dict or None = None):
+    """Runs a registered write in its own transaction and returns the affected row count."""
+    statement = REGISTRY[name]
+    start = time.perf_counter()
+    try:
+        with engine.begin() as conn:
+            result, prepared = _execute(conn, statement, params or {})
+            rows = int(result.rowcount or 0)
+    except Exception:
+        _record(name, time.perf_counter() - start, error=True)
+        raise
+    _record(name, time.perf_counter() - start, rows, prepared=prepared)
+    return rows
+
+
+def metrics():
+    """Per statement calls, errors, rows, total and mean latency and connections it was prepared on, slowest total first."""
+    with _lock:
+        stats = {name: dict(s) for name, s in _stats.items()}
+    result = {}
+    for name, s in sorted(stats.items(), key=lambda item: -item[1]["seconds"]):
+        result[name] = {
+            "calls": s["calls"],
+            "errors": s["errors"],
+            "rows": s["rows"],
+            "rows_per_call": round(s["rows"] / s["calls"], 2) if s["calls"] else None,
+            "total_ms": round(s["seconds"] * 1000, 3),
+            "mean_ms": round(s["seconds"] * 1000 / s["calls"], 3) if s["calls"] else None,
+            "prepares": s["prepares"],
+        }
+    return {"prepare": _prepare(), "statements": result}
+
+
+def reset():
+    with _lock:
+        for stats in _stats.values():
+            stats.update({"calls": 0, "errors": 0, "rows": 0, "seconds": 0.0, "prepares": 0})
@@ -0,0 +1,65 @@
+from sqlalchemy import Engine
+import numpy as np
+import pandas as pd
+
+import snapshot
+
+METRICS = ("sum", "avg", "median")
+
+# scope argument -> snapshot column it filters on
+SCOPE_COLUMNS = {
+    "city": "prpctynam",
+    "neighborhood": "nhdnam",
+}
+
+
+def _build_index(scope):
+    """
+    Per-street totactval sum/avg/median within each scope key, with one presorted
+    (descending) order per metric and the offsets of every scope key inside it.
+    """
+    def build(frame: pd.DataFrame):
+        df = pd.DataFrame({"street_name": frame["prpstrnam"], "value": frame["totactval"]})
+        for name in scope:
+            df[name] = snapshot.normalize(frame[SCOPE_COLUMNS[name]]).fillna("")
+        keys = list(scope) + ["street_name"]
+
+        streets = (df.groupby(keys, dropna=False)["value"]
+                     .agg(sum="sum", avg="mean", median="median", count="count")
+                     .reset_index())
+        streets = streets[streets["count"] > 0]
+
+        index = {}
+        for metric in METRICS:
+            ordered = streets.sort_values(list(scope) + [metric], ascending=[True] * len(scope) + [False],
+                                          kind="mergesort").reset_index(drop=True)
+            if scope:
+                scope_keys = ordered[list(scope)].apply(tuple, axis=1)
+                starts = np.flatnonzero(scope_keys.ne(scope_keys.shift()).to_numpy())
+                ends = np.append(starts[1:], len(ordered))
+                offsets = {scope_keys.iloc[s]: (s, e) for s, e in zip(starts, ends)}
+            else:
+                offsets = {(): (0, len(ordered))}
+            index[metric] = (ordered, offsets)
+        return index
+    return build
+
+
+def top_streets(engine: Engine, k: int = 3, metric: str = "sum", city: str or None = None,
+                neighborhood: str or None = None):
+    """Top k streets by totactval metric, county wide or within a city and/or neighborhood."""
+    if metric not in METRICS:
+        raise ValueError(f"Metric must be one of: {', '.join(METRICS)}")
+
+    filters = {name: value for name, value in (("city", city), ("neighborhood", neighborhood)) if value}
+    scope = tuple(filters)
+    index = snapshot.derived(engine, f"streets:{','.join(scope)}", _build_index(scope))
+
+    ordered, offsets = index[metric]
+    start, end = offsets.get(tuple(snapshot.normalize_key(v) for v in filters.values()), (0, 0))
+    top = ordered.iloc[start:min(end, start + k)]
+    return pd.DataFrame({
+        "street_value": top[metric].map(lambda v: f"{v:,.0f}"),
+        "street_name": top["street_name"].astype(object).where(top["street_name"].notna(), None),
+        "num_val": top[metric],
+    }).reset_index(drop=True)
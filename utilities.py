@@ -1,10 +1,29 @@
-from pyproj import Transformer
+from functools import lru_cache
+
+import lazy
+
+pyproj = lazy.module("pyproj")
+
+# parcel x_coord/y_coord are NAD83 / Colorado Central (US survey feet)
+PARCEL_CRS = "EPSG:2232"
+WGS84 = "EPSG:4326"
+
+
+@lru_cache(maxsize=None)
+def transformer(from_crs: str, to_crs: str):
+    """Transformers are slow to build, so build each direction once."""
+    return pyproj.Transformer.from_crs(from_crs, to_crs, always_xy=True)
 
 
 def coords_to_lat_long(x: int, y: int):
-    transformer = Transformer.from_crs("EPSG:2232", "EPSG:4326", always_xy=True)
-    lon, lat = transformer.transform(x, y)
+    lon, lat = transformer(PARCEL_CRS, WGS84).transform(x, y)
     print(lat, lon)
     return lat, lon
 
-# coords_to_lat_long(3063151, 1689004)
\ No newline at end of file
+
+def lat_long_to_coords(lat, lon):
+    """Reverse of coords_to_lat_long, works on scalars or numpy arrays."""
+    x, y = transformer(WGS84, PARCEL_CRS).transform(lon, lat)
+    return x, y
+
+# coords_to_lat_long(3063151, 1689004)
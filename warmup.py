@@ -0,0 +1,213 @@
+from datetime import date
+from sqlalchemy import Engine
+import os
+import threading
+import time
+
+import address_index
+import distributions
+import heatmap
+import movers
+import owners
+import parcel_dimension
+import query
+import rollup
+import singleflight
+import snapshot
+import spatial
+import streets
+
+# WARMUP_TASKS: comma separated task names, "all" (default) or "none"
+# WARMUP_REFRESH_SECONDS: reload the snapshot and recompute on this interval, 0 (default) disables
+RETRY_SECONDS = 30
+
+# the county wide answers served straight from memory once computed, called with the endpoint defaults
+PRECOMPUTED = [
+    query.most_valuable_streets,
+    query.most_valuable_street_types,
+    query.turnover_neighborhood,
+    query.turnover_subdivision,
+    query.value_change_by_neighborhood,
+]
+
+_results = {}
+_stop = threading.Event()
+_thread = None
+_writer = None
+# refreshes asked for by writes, one thread at a time runs them (writes during a run ask for one more)
+_refresh_lock = threading.Lock()
+_refresh_wanted = False
+_refresher = None
+_status = {"ready": False, "tasks": {}, "last_warmup": None, "last_refresh": None, "refreshes": 0, "error": None}
+
+
+def _warm_rollups(engine: Engine):
+    # the cuboids behind property-types-city, funfacts/typevalue and value-change
+    for dims in (["city", "owner_company"], ["street_type"], ["neighborhood", "taxcls_prefix"]):
+        rollup.cuboid(engine, dims)
+
+
+def _warm_distributions(engine: Engine):
+    for group in distributions.GROUP_COLUMNS:
+        distributions.group_entry(engine, group, "")
+
+
+def _warm_spatial(engine: Engine):
+    spatial.pin_index(engine)
+    spatial.record_index(engine)
+
+
+def _key(fn, args, kwargs):
+    # keyed without the engine, the answer is the same whichever replica serves it
+    return singleflight.flights.key(fn, (None,) + tuple(args[1:]), kwargs)
+
+
+def _value_change_indexes(engine: Engine):
+    if engine.dialect.name == "postgresql":
+        query.create_value_change_indexes(engine)
+
+
+def _stamp():
+    # turnover counts sales up to today, so precomputed answers only hold for the day they were made
+    return snapshot.data_version(), date.today()
+
+
+def _precompute(engine: Engine):
+    stamp = _stamp()
+    for fn in PRECOMPUTED:
+        _results[_key(fn, (engine,), {})] = (stamp, fn(engine))
+
+
+TASKS = {
+    # created on the writer, the only engine that can, rebuilt whenever the snapshot shows other parcel data
+    "parcel_dimension": lambda engine: parcel_dimension.sync(_writer or engine, engine),
+    "value_change_indexes": lambda engine: _value_change_indexes(_writer or engine),
+    "snapshot": snapshot.get_frame,
+    "rollup": _warm_rollups,
+    "streets": lambda engine: streets.top_streets(engine),
+    "distributions": _warm_distributions,
+    "address_index": lambda engine: address_index.suggest(engine, "1"),
+    "spatial": _warm_spatial,
+    "owners": owners.index,
+    "movers": lambda engine: movers.top_movers(engine, 1),
+    "heatmap": heatmap.warm,
+    "county": _precompute,
+}
+
+
+def configured_tasks():
+    names = os.getenv("WARMUP_TASKS", "all").strip().lower()
+    if names == "all":
+        return list(TASKS)
+    if names in ("", "none"):
+        return []
+    selected = [name.strip() for name in names.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in TASKS]
+    if unknown:
+        raise ValueError(f"Unknown WARMUP_TASKS: {', '.join(unknown)}")
+    return selected
+
+
+def refresh_seconds():
+    return float(os.getenv("WARMUP_REFRESH_SECONDS", "0"))
+
+
+def run(engine: Engine, names):
+    """Runs the named tasks in order, recording how long each took."""
+    for name in names:
+        start = time.perf_counter()
+        TASKS[name](engine)
+        _status["tasks"][name] = round(time.perf_counter() - start, 3)
+
+
+def call(fn, *args, **kwargs):
+    """Precomputed answer for this exact call if it is still current, otherwise the live query."""
+    cached = _results.get(_key(fn, args, kwargs))
+    if cached is not None and cached[0] == _stamp():
+        return cached[1].copy()
+    return singleflight.call(fn, *args, **kwargs)
+
+
+def _loop(engine: Engine, names, interval: float):
+    while not _status["ready"] and not _stop.is_set():
+        try:
+            run(engine, names)
+            _status["ready"] = True
+            _status["last_warmup"] = time.time()
+            _status["error"] = None
+        except Exception as e:
+            _status["error"] = str(e)
+            _stop.wait(RETRY_SECONDS)
+
+    while interval > 0 and not _stop.wait(interval):
+        try:
+            # builds the new snapshot and its structures beside the old one, requests keep using the old
+            # until the swap; unchanged data still reruns the tasks, for answers that depend on the date
+            if not snapshot.refresh(engine, lambda: run(engine, names)):
+                run(engine, names)
+            _status["last_refresh"] = time.time()
+            _status["refreshes"] += 1
+            _status["error"] = None
+        except Exception as e:
+            _status["error"] = str(e)
+
+
+def _refresh_writes(engine: Engine):
+    global _refresh_wanted, _refresher
+    while True:
+        with _refresh_lock:
+            if not _refresh_wanted:
+                _refresher = None
+                return
+            _refresh_wanted = False
+        try:
+            names = configured_tasks()
+            if not snapshot.refresh(engine, lambda: run(engine, names)):
+                run(engine, names)
+            _status["last_refresh"] = time.time()
+            _status["refreshes"] += 1
+            _status["error"] = None
+        except Exception as e:
+            _status["error"] = str(e)
+
+
+def refresh_after_write(engine: Engine):
+    """
+    Reloads the snapshot from engine (the writer) on a background thread after snapshot.mark_stale(),
+    rebuilding the warm-up structures before the swap so no request pays for the reload.
+    """
+    global _refresh_wanted, _refresher
+    with _refresh_lock:
+        _refresh_wanted = True
+        if _refresher is None:
+            _refresher = threading.Thread(target=_refresh_writes, args=(engine,), name="snapshot-refresh", daemon=True)
+            _refresher.start()
+
+
+def start(engine: Engine, writer: Engine or None = None):
+    """Starts warm-up (and the refresh scheduler, if configured) on a background thread."""
+    global _thread, _writer
+    _writer = writer
+    names = configured_tasks()
+    interval = refresh_seconds()
+    _stop.clear()
+    if not names:
+        _status["ready"] = True
+        if interval <= 0:
+            return
+    _thread = threading.Thread(target=_loop, args=(engine, names, interval), name="warmup", daemon=True)
+    _thread.start()
+
+
+def stop():
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+
+
+def is_ready():
+    return _status["ready"]
+
+
+def status():
+    return {**_status, "tasks": dict(_status["tasks"])}